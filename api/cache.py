@@ -0,0 +1,206 @@
+import sys, threading, time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+################# Cache #####################
+
+_MISSING = object()
+
+# Tous les caches créés, exposés sur /api/metrics (taux de succès, mémoire)
+CACHES = []
+
+def approximate_size(value) -> int:
+    """Taille approximative en octets : l'objet et ses attributs ou éléments directs (un seul niveau)"""
+    size = sys.getsizeof(value)
+    fields = getattr(value, '__dict__', None)
+    if fields is not None:
+        size += sys.getsizeof(fields) + sum(sys.getsizeof(item) for item in fields.values())
+    elif isinstance(value, dict):
+        size += sum(sys.getsizeof(key) + sys.getsizeof(item) for key, item in value.items())
+    elif isinstance(value, (tuple, list, set, frozenset)):
+        size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+class TTLCache:
+    """
+    Cache en mémoire borné (LRU) avec expiration des entrées (TTL)
+    Thread-safe : les routes synchrones sont exécutées dans un pool de threads
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, name: str = "cache"):
+        self.name = name
+        self.maxsize = max(int(maxsize), 1)
+        self.ttl = float(ttl)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.memory_bytes = 0
+        CACHES.append(self)
+
+    # -----------------------------------------------
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value, size = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.memory_bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float | None = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        size = approximate_size(key) + approximate_size(value)
+        with self._lock:
+            previous = self._data.get(key)
+            if previous is not None:
+                self.memory_bytes -= previous[2]
+            self._data[key] = (expires_at, value, size)
+            self.memory_bytes += size
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self.memory_bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                entry = self._data.pop(key, _MISSING)
+                if entry is not _MISSING:
+                    self.memory_bytes -= entry[2]
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+            self.memory_bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    # -----------------------------------------------
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "backend": "memory",
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "memory_bytes": self.memory_bytes,
+            }
+
+# -----------------------------------------------
+class RedisCache:
+    """
+    Cache partagé entre workers et machines, sur Redis (module `redis`), avec la même interface que TTLCache
+    Les valeurs passent par encode / decode (octets). Une erreur Redis se comporte comme une absence :
+    l'appelant relit la base, le service continue sans cache
+    """
+
+    def __init__(self, url: str, ttl: float = 60.0, name: str = "cache", encode=None, decode=None, prefix: str = "api", timeout: float = 0.5):
+        if redis is None:
+            raise RuntimeError("Le module redis n'est pas installé (pip install redis)")
+        self.name = name
+        self.ttl = float(ttl)
+        self.prefix = f"{prefix}:{name}:"
+        self.encode = encode or (lambda value: value)
+        self.decode = decode or (lambda value: value)
+        self.client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalidations = 0
+        CACHES.append(self)
+
+    def _key(self, key) -> str:
+        return self.prefix + (":".join(str(part) for part in key) if isinstance(key, tuple) else str(key))
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    # -----------------------------------------------
+    def get(self, key, default=None):
+        try:
+            data = self.client.get(self._key(key))
+        except redis.RedisError:
+            self._count('errors')
+            data = None
+        if data is None:
+            self._count('misses')
+            return default
+        self._count('hits')
+        return self.decode(data)
+
+    def set(self, key, value, ttl: float | None = None):
+        try:
+            self.client.set(self._key(key), self.encode(value), px=max(int((self.ttl if ttl is None else ttl) * 1000), 1))
+        except redis.RedisError:
+            self._count('errors')
+
+    def invalidate(self, *keys):
+        if not keys:
+            return
+        try:
+            deleted = self.client.delete(*[self._key(key) for key in keys])
+        except redis.RedisError:
+            self._count('errors')
+            return
+        with self._lock:
+            self.invalidations += deleted
+
+    def clear(self):
+        try:
+            keys = list(self.client.scan_iter(match=self.prefix + "*", count=1000))
+            if keys:
+                self.client.delete(*keys)
+        except redis.RedisError:
+            self._count('errors')
+
+    # -----------------------------------------------
+    def stats(self):
+        # Mémoire : celle du serveur Redis entier (le coût par préfixe demanderait un parcours des clés)
+        try:
+            memory_bytes = self.client.info('memory').get('used_memory')
+        except redis.RedisError:
+            memory_bytes = None
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "backend": "redis",
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "errors": self.errors,
+                "invalidations": self.invalidations,
+                "memory_bytes": memory_bytes,
+            }
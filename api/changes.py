@@ -0,0 +1,265 @@
+import asyncio, datetime as dt
+from collections import deque
+
+from sqlmodel import Session, select, delete, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import models, serialization, utils
+from .database import async_engine
+from topazdevsdk import colors
+
+################# Change feed #####################
+
+# Journal des modifications des utilisateurs (table userchange), écrit dans la transaction de chaque écriture
+# (crud.create_user, update_user, delete_user, loadsecurity, import en masse) et diffusé sur /api/users/changes.
+# Un seul lecteur par processus (ChangeBroadcaster) interroge la table et distribue les nouveautés à tous
+# les abonnés : N clients connectés ne font pas N requêtes. Les écritures du processus réveillent le lecteur
+# immédiatement, celles des autres workers sont vues au plus tard après poll_interval secondes.
+
+POLL_INTERVAL = utils.CHANGES.get('poll_interval', 1.0)
+HEARTBEAT_INTERVAL = utils.CHANGES.get('heartbeat_interval', 15.0)
+HISTORY_SIZE = utils.CHANGES.get('history_size', 1000)
+QUEUE_SIZE = utils.CHANGES.get('queue_size', 100)
+RETENTION_HOURS = utils.CHANGES.get('retention_hours', 24)
+PRUNE_INTERVAL = 3600
+READ_BATCH = 500
+
+class ChangesExpired(Exception):
+    """`since` est antérieur aux entrées conservées : le client doit relire la liste complète"""
+
+# -----------------------------------------------
+def record_change(db, operation: str, user):
+    """
+    Ajoute l'entrée du journal à la transaction en cours de `db` (le commit reste à l'appelant)
+    user : ligne ou copie portant id, username et les champs de UserRead
+    """
+    db.add(models.UserChange(
+        user_id=user.id,
+        operation=operation,
+        username=user.username,
+        data=None if operation == "delete" else serialization.encode_user(user).decode('utf-8')
+    ))
+
+def encode_change(change: models.UserChange) -> bytes:
+    """Événement JSON encodé une fois et partagé par tous les abonnés ; `data` est déjà du JSON"""
+    head = serialization.dumps({
+        "id": change.id,
+        "operation": change.operation,
+        "user_id": change.user_id,
+        "username": change.username,
+        "changed_at": change.changed_at,
+    })
+    return head[:-1] + b',"user":' + (change.data.encode('utf-8') if change.data else b'null') + b'}'
+
+def _read_statement(after_id: int, limit: int = READ_BATCH):
+    return select(models.UserChange).where(models.UserChange.id > after_id).order_by(models.UserChange.id).limit(limit)
+
+def _prune_statement():
+    return delete(models.UserChange).where(models.UserChange.changed_at < dt.datetime.now() - dt.timedelta(hours=RETENTION_HOURS))
+
+def prune(db: Session):
+    """Supprime les entrées plus anciennes que retention_hours (au démarrage, puis toutes les heures par le lecteur)"""
+    db.exec(_prune_statement())
+    db.commit()
+
+async def _head(db: AsyncSession) -> int:
+    return (await db.exec(select(func.max(models.UserChange.id)))).one() or 0
+
+# -----------------------------------------------
+class Subscriber:
+    __slots__ = ('queue',)
+
+    def __init__(self, size: int):
+        # Lots de (id, événement encodé) ; None : abonné trop lent, déconnecté
+        self.queue = asyncio.Queue(maxsize=size)
+
+class ChangeBroadcaster:
+    """
+    Lecteur unique du journal pour le processus, actif tant qu'il y a des abonnés
+    Garde en mémoire les `history_size` derniers événements : un client qui se reconnecte
+    avec un `since` récent est servi sans requête
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL, history_size: int = HISTORY_SIZE, queue_size: int = QUEUE_SIZE):
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.history = deque(maxlen=history_size)
+        self.subscribers = set()
+        self.last_id = None
+        self.polls = 0
+        self.dropped = 0
+        self._loop = None
+        self._wake = None
+        self._task = None
+        self._pruned_at = None
+
+    def notify(self):
+        """Réveille le lecteur après un commit local ; appelable depuis n'importe quel thread"""
+        loop, wake = self._loop, self._wake
+        if loop is not None and wake is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wake.set)
+
+    # -----------------------------------------------
+    async def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.queue_size)
+        self.subscribers.add(subscriber)
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._wake = asyncio.Event()
+            if self.last_id is None:
+                async with AsyncSession(async_engine) as db:
+                    self.last_id = await _head(db)
+            else:
+                # Lecteur redémarré : rattrape tout de suite les modifications faites pendant son arrêt
+                self._wake.set()
+            self._task = asyncio.create_task(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def stop(self):
+        for subscriber in list(self.subscribers):
+            self._drop(subscriber)
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def _drop(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+    # -----------------------------------------------
+    async def _run(self):
+        while self.subscribers:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self._poll()
+            except Exception as e:
+                # Base momentanément indisponible : nouvel essai au prochain intervalle
+                print(f"{colors.BColors.YELLOW}WARNING{colors.BColors.END}:  Journal des modifications illisible : {e}")
+
+    async def _poll(self):
+        async with AsyncSession(async_engine) as db:
+            now = asyncio.get_running_loop().time()
+            if self._pruned_at is None or now - self._pruned_at >= PRUNE_INTERVAL:
+                self._pruned_at = now
+                await db.exec(_prune_statement())
+                await db.commit()
+            while True:
+                changes = (await db.exec(_read_statement(self.last_id))).all()
+                if changes:
+                    self._publish([(change.id, encode_change(change)) for change in changes])
+                if len(changes) < READ_BATCH:
+                    break
+        self.polls += 1
+
+    def _publish(self, batch: list):
+        self.history.extend(batch)
+        self.last_id = batch[-1][0]
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait(batch)
+            except asyncio.QueueFull:
+                # Abonné qui ne lit plus : déconnecté, il reprendra avec son dernier id
+                self.dropped += 1
+                self._drop(subscriber)
+
+    # -----------------------------------------------
+    async def backlog(self, since: int, limit: int = READ_BATCH) -> list:
+        """
+        Événements d'id > since, au plus `limit` : depuis l'historique en mémoire si possible, sinon depuis la base
+        Lève ChangesExpired si des entrées postérieures à since ont été purgées
+        """
+        if self.last_id is not None and since >= self.last_id:
+            return []
+        if self.history and since >= self.history[0][0] - 1:
+            return [event for event in self.history if event[0] > since][:limit]
+        async with AsyncSession(async_engine) as db:
+            oldest = (await db.exec(select(func.min(models.UserChange.id)))).one()
+            if oldest is not None and since < oldest - 1:
+                raise ChangesExpired(since)
+            changes = (await db.exec(_read_statement(since, limit))).all()
+        return [(change.id, encode_change(change)) for change in changes]
+
+    def stats(self):
+        return {
+            "subscribers": len(self.subscribers),
+            "last_id": self.last_id,
+            "history": len(self.history),
+            "polls": self.polls,
+            "dropped": self.dropped,
+        }
+
+BROADCASTER = ChangeBroadcaster()
+
+def notify():
+    BROADCASTER.notify()
+
+# -----------------------------------------------
+async def current_id() -> int:
+    if BROADCASTER.last_id is not None and BROADCASTER.subscribers:
+        return BROADCASTER.last_id
+    async with AsyncSession(async_engine) as db:
+        return await _head(db)
+
+async def wait_for_changes(since: int, timeout: float) -> tuple:
+    """Long-poll : (événements, dernier id) dès qu'il existe des modifications après since, sinon après timeout"""
+    subscriber = await BROADCASTER.subscribe()
+    try:
+        events = await BROADCASTER.backlog(since)
+        if not events and timeout > 0:
+            try:
+                batch = await asyncio.wait_for(subscriber.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                batch = None
+            events = [event for event in batch or [] if event[0] > since]
+        return events, events[-1][0] if events else max(since, BROADCASTER.last_id or 0)
+    finally:
+        BROADCASTER.unsubscribe(subscriber)
+
+def encode_events(events: list, last_id: int) -> bytes:
+    return b'{"last_id":' + str(last_id).encode('ascii') + b',"changes":[' + b','.join(event for _, event in events) + b']}'
+
+def _sse(events: list) -> bytes:
+    return b''.join(b'id: %d\nevent: user\ndata: %s\n\n' % (change_id, event) for change_id, event in events)
+
+async def stream(since: int | None):
+    """Flux SSE : événements manqués depuis since, puis modifications en direct ; commentaire keep-alive périodique"""
+    subscriber = await BROADCASTER.subscribe()
+    try:
+        cursor = BROADCASTER.last_id if since is None else since
+        yield b'retry: 2000\n\n'
+        while since is not None:
+            events = await BROADCASTER.backlog(cursor)
+            if not events:
+                break
+            yield _sse(events)
+            cursor = events[-1][0]
+        while True:
+            try:
+                batch = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield b': keep-alive\n\n'
+                continue
+            if batch is None:
+                return
+            events = [event for event in batch if event[0] > cursor]
+            if events:
+                yield _sse(events)
+                cursor = events[-1][0]
+    except ChangesExpired:
+        yield b'event: expired\ndata: {}\n\n'
+    finally:
+        BROADCASTER.unsubscribe(subscriber)
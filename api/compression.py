@@ -0,0 +1,193 @@
+import time, zlib
+from contextvars import ContextVar
+
+from . import utils
+from .static import accepted_encodings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+################# Compression #####################
+
+# Compression des réponses dynamiques (JSON, NDJSON, CSV, HTML) selon Accept-Encoding :
+# zstd (module zstandard) et br (module brotli) s'ils sont installés, gzip sinon.
+# Ne sont pas recompressées : les réponses qui ont déjà un Content-Encoding (pages en cache, fichiers
+# précompressés de /assets), les types hors de la liste, les corps plus petits que minimum_size,
+# les réponses Cache-Control: no-transform. Les réponses en flux sont compressées morceau par morceau
+# (avec flush) : chaque morceau part dès qu'il est produit.
+# Le temps CPU de compression et les octets avant / après sont relevés par requête (api.metrics).
+
+ENABLED = utils.COMPRESSION.get('enabled', True)
+MINIMUM_SIZE = utils.COMPRESSION.get('minimum_size', 1024)
+GZIP_LEVEL = utils.COMPRESSION.get('gzip_level', 6)
+BROTLI_QUALITY = utils.COMPRESSION.get('brotli_quality', 4)
+ZSTD_LEVEL = utils.COMPRESSION.get('zstd_level', 3)
+CONTENT_TYPES = frozenset(utils.COMPRESSION.get('content_types', [
+    "application/json", "application/x-ndjson", "application/xml", "application/javascript",
+    "text/html", "text/plain", "text/css", "text/csv", "text/xml", "text/javascript", "image/svg+xml",
+]))
+
+AVAILABLE = {"gzip": True, "br": brotli is not None, "zstd": zstandard is not None}
+# Ordre de préférence quand le client accepte plusieurs encodages ; ceux dont le module manque sont ignorés
+ENCODINGS = tuple(name for name in utils.COMPRESSION.get('encodings', ["zstd", "br", "gzip"]) if AVAILABLE.get(name))
+
+# Mesures de la requête en cours, créées par metrics.MetricsMiddleware
+COMPRESSION_STATS = ContextVar("compression_stats", default=None)
+
+class CompressionStats:
+    __slots__ = ('encoding', 'seconds', 'bytes_in', 'bytes_out')
+
+    def __init__(self):
+        self.encoding = None
+        self.seconds = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+# -----------------------------------------------
+class _GzipEncoder:
+    def __init__(self):
+        # wbits 31 : en-tête et somme de contrôle gzip
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        return self._compressor.compress(data) + (self._compressor.flush(zlib.Z_SYNC_FLUSH) if flush else b"")
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+class _BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        return self._compressor.process(data) + (self._compressor.flush() if flush else b"")
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+class _ZstdEncoder:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        return self._compressor.compress(data) + (self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK) if flush else b"")
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+ENCODERS = {"gzip": _GzipEncoder, "br": _BrotliEncoder, "zstd": _ZstdEncoder}
+
+def choose_encoding(accept_encoding: str):
+    if not accept_encoding:
+        return None
+    accepted = accepted_encodings(accept_encoding)
+    for name in ENCODINGS:
+        if name in accepted:
+            return name
+    return None
+
+def _compressible(headers: dict) -> bool:
+    if "content-encoding" in headers or "no-transform" in headers.get("cache-control", ""):
+        return False
+    return headers.get("content-type", "").split(";")[0].strip().lower() in CONTENT_TYPES
+
+################# Middleware #####################
+
+class CompressionMiddleware:
+    """Middleware ASGI pur : la réponse n'est mise en mémoire que si elle tient en un seul message"""
+
+    def __init__(self, app, minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            return await self.app(scope, receive, send)
+        encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                encoding = choose_encoding(value.decode("latin-1"))
+                break
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        stats = COMPRESSION_STATS.get()
+        start_message = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, encoder, passthrough
+            if passthrough:
+                return await send(message)
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in message.get("headers", [])}
+                length = headers.get("content-length")
+                if message["status"] in (204, 304) or not _compressible(headers) or (length is not None and int(length) < self.minimum_size):
+                    passthrough = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None and not more_body and len(body) < self.minimum_size:
+                passthrough = True
+                await send(start_message)
+                return await send(message)
+
+            first = encoder is None
+            if first:
+                encoder = ENCODERS[encoding]()
+            started_at = time.thread_time()
+            data = encoder.compress(body, flush=more_body)
+            if not more_body:
+                data += encoder.finish()
+            _record(stats, encoding, time.thread_time() - started_at, len(body), len(data))
+            if first:
+                # Corps en un seul message : longueur connue ; en flux : Transfer-Encoding chunked
+                await send({**start_message, "headers": _compressed_headers(start_message, encoding, None if more_body else len(data))})
+            if data or not more_body:
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+def _record(stats, encoding: str, seconds: float, bytes_in: int, bytes_out: int):
+    if stats is not None:
+        stats.encoding = encoding
+        stats.seconds += seconds
+        stats.bytes_in += bytes_in
+        stats.bytes_out += bytes_out
+
+def _compressed_headers(message: dict, encoding: str, length: int | None) -> list:
+    headers = []
+    vary = None
+    for name, value in message.get("headers", []):
+        lower = name.lower()
+        if lower == b"content-length":
+            continue
+        if lower == b"vary":
+            vary = value
+            continue
+        if lower == b"etag" and value.startswith(b'"'):
+            # Autre représentation que l'original : l'ETag fort devient faible (If-None-Match compare en faible)
+            value = b"W/" + value
+        headers.append((name, value))
+    headers.append((b"content-encoding", encoding.encode("ascii")))
+    if vary is None:
+        vary = b"Accept-Encoding"
+    elif b"accept-encoding" not in vary.lower() and vary != b"*":
+        vary += b", Accept-Encoding"
+    headers.append((b"vary", vary))
+    if length is not None:
+        headers.append((b"content-length", str(length).encode("ascii")))
+    return headers
@@ -1,96 +1,284 @@
 from typing import Annotated
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
-from sqlmodel import Session, select
-import hashlib
+from sqlmodel import Session, select, func, update, delete, insert, or_, and_
+from sqlalchemy import table as sa_table, column as sa_column, text as sa_text, union_all
+from sqlalchemy.exc import IntegrityError
+import asyncio
+from sqlmodel.ext.asyncio.session import AsyncSession
+import base64, json
+from types import SimpleNamespace
+import datetime as dt
 
-from . import models, schemas
-from .database import get_db
+from . import models, schemas, utils, hashing, tokens, changes
+from .cache import TTLCache, RedisCache, redis
+from .database import get_async_db, init_lock, SEARCH_INDEX, SEARCH_TABLE
 from topazdevsdk import colors
 
 ################# Security #####################
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Cache des profils des utilisateurs authentifiés (username -> utilisateur), évite un SELECT par requête
+PRINCIPAL_CACHE = TTLCache(
+    maxsize=utils.CACHE.get('principal', {}).get('maxsize', 1024),
+    ttl=utils.CACHE.get('principal', {}).get('ttl', 60),
+    name="principal"
+)
+
 # -----------------------------------------------
-async def secu_get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)):
-    user = secu_decode_token(db, token)
-    if not user:
+async def secu_get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: AsyncSession = Depends(get_async_db)):
+    # Validation du jeton par calcul uniquement ; la base n'est lue que pour rafraîchir la liste de révocation
+    principal = secu_decode_token(token)
+    if principal is None or await async_secu_is_token_revoked(db, principal.jti):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return user
+    return principal
 
-async def secu_get_current_active_user(current_user: Annotated[schemas.Users, Depends(secu_get_current_user)]):
+async def secu_get_current_active_user(current_user: Annotated[schemas.Principal, Depends(secu_get_current_user)]):
     if current_user.is_disabled:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return JSONResponse(content=jsonable_encoder(current_user))
+    return current_user
 
 # -----------------------------------------------
 def hash_password(password: str):
-    return hashlib.sha256(password.encode('utf-8')).hexdigest()
+    return hashing.hash_password(password)
+
+def secu_decode_token(token: str):
+    """Valide un jeton signé et retourne l'utilisateur qu'il représente (admins actifs uniquement)"""
+    claims = tokens.decode(token)
+    if claims is None or not claims.get('adm') or claims.get('dis'):
+        return None
+    return schemas.Principal(
+        id=claims['uid'],
+        username=claims['sub'],
+        is_admin=claims['adm'],
+        is_disabled=claims['dis'],
+        jti=claims['jti'],
+        expires_at=claims['exp']
+    )
 
-def secu_decode_token(db: Session, token):
-    user = secu_get_user_by_username(db, token)
+async def async_secu_get_profile(db: AsyncSession, username: str):
+    """Profil complet de l'utilisateur authentifié, servi depuis PRINCIPAL_CACHE"""
+    user = PRINCIPAL_CACHE.get(username)
+    if user is not None:
+        return user
+    db_user = await async_secu_get_user_by_username(db, username)
+    if not db_user:
+        return None
+    # Copie détachée de la session : l'objet ORM ne peut pas être partagé entre requêtes
+    user = schemas.Users.model_validate(db_user, from_attributes=True)
+    PRINCIPAL_CACHE.set(username, user)
     return user
 
+# -----------------------------------------------
+async def async_secu_create_session(db: AsyncSession, user: models.Users):
+    """Émet un jeton et enregistre sa session (pour pouvoir la révoquer)"""
+    token, jti, expires_at = tokens.create_access_token(user)
+    now = dt.datetime.now()
+    db.add(models.ActiveSession(
+        username=user.username,
+        access_token=jti,
+        expiry_time=dt.datetime.fromtimestamp(expires_at)
+    ))
+    # Les sessions expirées n'ont plus besoin d'être conservées, même révoquées
+    await db.exec(delete(models.ActiveSession).where(models.ActiveSession.expiry_time < now))
+    await db.commit()
+    return schemas.Token(access_token=token, token_type="bearer", expires_in=expires_at - int(now.timestamp()))
+
+async def async_secu_is_token_revoked(db: AsyncSession, jti: str):
+    revocations = tokens.REVOCATIONS
+    if revocations.begin_refresh():
+        statement = select(models.ActiveSession.access_token).where(models.ActiveSession.is_revoked == True).where(models.ActiveSession.expiry_time > dt.datetime.now())
+        try:
+            results = (await db.exec(statement)).all()
+        except Exception:
+            revocations.abort_refresh()
+            raise
+        revocations.complete_refresh(results)
+    elif not revocations.loaded:
+        # Premier chargement en cours dans une autre requête : la liste est encore vide, lecture directe de ce jti
+        statement = select(models.ActiveSession.id).where(models.ActiveSession.access_token == jti).where(models.ActiveSession.is_revoked == True)
+        return (await db.exec(statement)).first() is not None
+    return jti in revocations
+
+async def async_secu_revoke_token(db: AsyncSession, jti: str):
+    statement = update(models.ActiveSession).where(models.ActiveSession.access_token == jti).values(is_revoked=True)
+    await db.exec(statement)
+    await db.commit()
+    tokens.REVOCATIONS.add(jti)
+
+def _revoke_sessions_statement(usernames):
+    return update(models.ActiveSession).where(models.ActiveSession.username.in_(usernames)).where(models.ActiveSession.is_revoked == False).values(is_revoked=True)
+
+def _stage_session_revocation(db: Session, usernames) -> list:
+    """Révoque les sessions dans la transaction en cours (commit à l'appelant) ; retourne les jti révoqués"""
+    if _supports_returning(db, "update"):
+        # Une seule requête : les jti révoqués sont renvoyés par l'UPDATE
+        return db.exec(_revoke_sessions_statement(usernames).returning(models.ActiveSession.access_token)).scalars().all()
+    statement = select(models.ActiveSession.access_token).where(models.ActiveSession.username.in_(usernames)).where(models.ActiveSession.is_revoked == False)
+    jtis = db.exec(statement).all()
+    if jtis:
+        db.exec(update(models.ActiveSession).where(models.ActiveSession.access_token.in_(jtis)).values(is_revoked=True))
+    return jtis
+
+async def _async_stage_session_revocation(db: AsyncSession, usernames) -> list:
+    if _supports_returning(db, "update"):
+        return (await db.exec(_revoke_sessions_statement(usernames).returning(models.ActiveSession.access_token))).scalars().all()
+    statement = select(models.ActiveSession.access_token).where(models.ActiveSession.username.in_(usernames)).where(models.ActiveSession.is_revoked == False)
+    jtis = (await db.exec(statement)).all()
+    if jtis:
+        await db.exec(update(models.ActiveSession).where(models.ActiveSession.access_token.in_(jtis)).values(is_revoked=True))
+    return jtis
+
+def _sessions_revoked(jtis):
+    """Après le commit : les jetons révoqués sont refusés tout de suite par ce worker"""
+    if jtis:
+        tokens.REVOCATIONS.add(*jtis)
+
+def secu_invalidate_principal(*usernames):
+    """Retire du cache les profils des utilisateurs authentifiés dont la ligne a changé"""
+    PRINCIPAL_CACHE.invalidate(*[username for username in usernames if username])
+
 def secu_get_user_by_username(db: Session, username: str):
     statement = select(models.Users).where(models.Users.username == username).where(models.Users.is_admin == True).where(models.Users.is_disabled == False)
     results = db.exec(statement)
     return results.first()
 
+async def async_secu_get_user_by_username(db: AsyncSession, username: str):
+    statement = select(models.Users).where(models.Users.username == username).where(models.Users.is_admin == True).where(models.Users.is_disabled == False)
+    results = await db.exec(statement)
+    return results.first()
+
+async def async_secu_upgrade_password_hash(db: AsyncSession, user: models.Users, hashed_password: str):
+    """Remplace un hash obsolète (SHA-256, paramètres de coût modifiés) après un login réussi"""
+    user.hashed_password = hashed_password
+    db.add(user)
+    await db.commit()
+    secu_invalidate_principal(user.username)
+    invalidate_cached_users(user)
+
 def secu_get_user_by_email(db: Session, email: str):
     statement = select(models.Users).where(models.Users.email == email).where(models.Users.is_admin == True).where(models.Users.is_disabled == False)
     results = db.exec(statement)
     return results.first()
 
+def _security_user_matches(user: models.Users, json) -> bool:
+    """L'utilisateur de sécurité correspond déjà à la configuration (mot de passe vérifié, hash à jour)"""
+    if (user.full_name, user.email) != (json['full_name'], json.get('email', json['username'] + '@admin.local')):
+        return False
+    if not user.is_admin or user.is_disabled or user.is_visible:
+        return False
+    password_ok, needs_rehash = hashing.verify_password(json['password'], user.hashed_password)
+    return password_ok and not needs_rehash
+
 def loadsecurity(db: Session, json):
+    """
+    Crée ou met à jour l'utilisateur de sécurité (admin) depuis la configuration
+    Idempotent : aucune écriture si l'utilisateur correspond déjà à la configuration. Un verrou fichier
+    sérialise les workers qui démarrent ensemble ; les suivants trouvent l'utilisateur à jour
+    """
     # Gestion du password vide
     if json['password']=="":
         print(f"{colors.BColors.RED}ERROR{colors.BColors.END}:    Security load error, password null")
         return {"fonction": "loadsecurity", "erreur": 'Le mot de passe ne peut pas être vide'}
     try:
-        user = get_user_by_username(db, json['username'])     
-        user_dict = models.Users(
-            username = json['username'],
-            full_name = json['full_name'],
-            email = json.get('email', json['username'] + '@admin.local'),
-            hashed_password = hash_password(json['password']),
-            is_admin = True,
-            is_disabled = False,
-            is_visible = False
-        )
-        if not user:
-            db.add(user_dict)
-            db.commit()
-            db.refresh(user_dict)
-            print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Utilisateur de sécurité créé")
-            return {"result": 'Utilisateur de sécurité créé'}
-        else:
-            statement = select(models.Users).where(models.Users.username == user_dict.username)
-            result = db.exec(statement).one()
-            result.username = user_dict.username
-            result.full_name = user_dict.full_name
-            result.email = user_dict.email
-            result.hashed_password = user_dict.hashed_password
-            result.is_admin = True
-            result.is_disabled = False
-            result.is_visible = False
-            db.add(result)
-            db.commit()
-            db.refresh(result)
-            
-            print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Utilisateur de sécurité modifié")
-            return {"result": 'Utilisateur de sécurité modifié'}
+        with init_lock('security'):
+            user = get_user_by_username(db, json['username'])
+            if user and _security_user_matches(user, json):
+                print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Utilisateur de sécurité à jour")
+                return {"result": 'Utilisateur de sécurité à jour'}
+
+            user_dict = models.Users(
+                username = json['username'],
+                full_name = json['full_name'],
+                email = json.get('email', json['username'] + '@admin.local'),
+                hashed_password = hash_password(json['password']),
+                is_admin = True,
+                is_disabled = False,
+                is_visible = False
+            )
+            if not user:
+                db.add(user_dict)
+                db.flush()
+                changes.record_change(db, "create", user_dict)
+                db.commit()
+                db.refresh(user_dict)
+                secu_invalidate_principal(user_dict.username)
+                invalidate_cached_users(user_dict)
+                invalidate_admin_presence()
+                changes.notify()
+                print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Utilisateur de sécurité créé")
+                return {"result": 'Utilisateur de sécurité créé'}
+            else:
+                previous = _user_cache_identity(user)
+                # Comme update_user : nouveau mot de passe ou droits modifiés, les jetons émis avant sont révoqués
+                # (un simple rehash du même mot de passe ne les révoque pas)
+                revokes = not hashing.verify_password(json['password'], user.hashed_password)[0] or not user.is_admin or user.is_disabled
+                user.full_name = user_dict.full_name
+                user.email = user_dict.email
+                user.hashed_password = user_dict.hashed_password
+                user.is_admin = True
+                user.is_disabled = False
+                user.is_visible = False
+                _bump_revision(user)
+                db.add(user)
+                db.flush()
+                changes.record_change(db, "update", user)
+                jtis = _stage_session_revocation(db, [user.username]) if revokes else []
+                db.commit()
+                db.refresh(user)
+                _sessions_revoked(jtis)
+                secu_invalidate_principal(user_dict.username)
+                invalidate_cached_users(previous, user)
+                invalidate_admin_presence()
+                changes.notify()
+                
+                print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Utilisateur de sécurité modifié")
+                return {"result": 'Utilisateur de sécurité modifié'}
     except:
         print(f"{colors.BColors.RED}ERROR{colors.BColors.END}:    Erreur lors du chargement de la sécurité")
         return {"fonction": "loadsecurity", "erreur": 'Erreur lors du chargement de la sécurité'}
 
     
+############### Admins #############
+
+# Nombre d'administrateurs actifs, recalculé via l'index (is_admin, is_disabled) après chaque écriture
+ADMIN_CACHE = TTLCache(
+    maxsize=1,
+    ttl=utils.CACHE.get('admin', {}).get('ttl', 30),
+    name="admin"
+)
+
+def count_active_admins(db: Session):
+    statement = select(func.count()).select_from(models.Users).where(models.Users.is_admin == True).where(models.Users.is_disabled == False)
+    return db.exec(statement).one()
+
+def has_active_admin(db: Session):
+    count = ADMIN_CACHE.get('count')
+    if count is None:
+        count = count_active_admins(db)
+        ADMIN_CACHE.set('count', count)
+    return count > 0
+
+async def async_count_active_admins(db: AsyncSession):
+    statement = select(func.count()).select_from(models.Users).where(models.Users.is_admin == True).where(models.Users.is_disabled == False)
+    results = await db.exec(statement)
+    return results.one()
+
+async def async_has_active_admin(db: AsyncSession):
+    count = ADMIN_CACHE.get('count')
+    if count is None:
+        count = await async_count_active_admins(db)
+        ADMIN_CACHE.set('count', count)
+    return count > 0
+
+def invalidate_admin_presence():
+    ADMIN_CACHE.clear()
+
 ############### Users #############
 
 def get_user_by_username(db: Session, username: str):
@@ -113,6 +301,289 @@ def get_users(db: Session, skip: int = 0, limit: int = 100):
     results = db.exec(statement)
     return results.all()
 
+async def async_get_user_by_username(db: AsyncSession, username: str):
+    statement = select(models.Users).where(models.Users.username == username)
+    results = await db.exec(statement)
+    return results.first()
+
+async def async_get_user_by_id(db: AsyncSession, user_id: int):
+    statement = select(models.Users).where(models.Users.id == user_id)
+    results = await db.exec(statement)
+    return results.first()
+
+def get_users_after(db: Session, after_id: int | None = None, limit: int = 100):
+    """Pagination par curseur (keyset) sur la clé primaire : coût constant quelle que soit la page"""
+    statement = select(models.Users).order_by(models.Users.id).limit(limit)
+    if after_id is not None:
+        statement = statement.where(models.Users.id > after_id)
+    results = db.exec(statement)
+    return results.all()
+
+async def async_get_users_after(db: AsyncSession, after_id: int | None = None, limit: int = 100):
+    statement = select(models.Users).order_by(models.Users.id).limit(limit)
+    if after_id is not None:
+        statement = statement.where(models.Users.id > after_id)
+    results = await db.exec(statement)
+    return results.all()
+
+def iter_users(db: Session, chunk_size: int = 500):
+    """Parcourt toute la table via un curseur serveur, sans charger toutes les lignes en mémoire"""
+    statement = select(models.Users).order_by(models.Users.id).execution_options(yield_per=chunk_size)
+    yield from db.exec(statement)
+
+def encode_cursor(last_id: int, key: str = "id"):
+    payload = json.dumps({key: last_id}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).rstrip(b'=').decode('ascii')
+
+def decode_cursor(cursor: str, key: str = "id"):
+    """Décode un curseur opaque, lève ValueError s'il est invalide"""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        last_id = json.loads(payload)[key]
+    except Exception:
+        raise ValueError("Curseur invalide")
+    if not isinstance(last_id, int) or last_id < 0:
+        raise ValueError("Curseur invalide")
+    return last_id
+
+############### User cache #############
+
+# Cache de lecture des utilisateurs pour les routes de lecture : clés ("id", 5), ("username", "bob"),
+# ("email", "b@x") -> copie détachée (schemas.CachedUser, sans hashed_password), ou False pour un utilisateur absent (negative_ttl, court).
+# Backend "memory" : LRU du processus ; backend "redis" (cache.users.redis_url) : partagé entre workers.
+# Chaque écriture invalide exactement les clés des lignes touchées (anciennes et nouvelles valeurs).
+# Avec le backend memory et plusieurs workers, un autre worker peut servir une copie périmée au plus `ttl` secondes.
+
+USER_CACHE_CONFIG = utils.CACHE.get('users', {})
+USER_CACHE_ENABLED = USER_CACHE_CONFIG.get('enabled', True)
+USER_NEGATIVE_TTL = USER_CACHE_CONFIG.get('negative_ttl', 5)
+USER_CACHE_KEYS = ("id", "username", "email")
+
+def _encode_cached_user(user):
+    return user.model_dump_json().encode('utf-8') if user else b""
+
+def _decode_cached_user(data: bytes):
+    return schemas.CachedUser.model_validate_json(data) if data else False
+
+def _create_user_cache():
+    if USER_CACHE_CONFIG.get('backend', 'memory') == 'redis':
+        if redis is not None:
+            return RedisCache(
+                url=USER_CACHE_CONFIG.get('redis_url', 'redis://localhost:6379/0'),
+                ttl=USER_CACHE_CONFIG.get('ttl', 30),
+                name="users",
+                encode=_encode_cached_user,
+                decode=_decode_cached_user
+            )
+        print(f"{colors.BColors.YELLOW}WARNING{colors.BColors.END}:  cache.users.backend = redis mais le module redis n'est pas installé, cache en mémoire")
+    return TTLCache(
+        maxsize=USER_CACHE_CONFIG.get('maxsize', 10000),
+        ttl=USER_CACHE_CONFIG.get('ttl', 30),
+        name="users"
+    )
+
+USER_CACHE = _create_user_cache()
+
+# Incrémenté à chaque invalidation : une lecture commencée avant une écriture ne remet pas l'ancienne ligne en cache
+_user_cache_generation = 0
+
+def _user_cache_get(key):
+    """Retourne (trouvé, utilisateur ou None)"""
+    if not USER_CACHE_ENABLED:
+        return False, None
+    user = USER_CACHE.get(key)
+    if user is None:
+        return False, None
+    return True, user or None
+
+def _user_cache_set(key, db_user, generation: int):
+    """Met en cache le résultat d'une lecture en base et retourne la copie détachée (ou None)"""
+    user = schemas.CachedUser.model_validate(db_user, from_attributes=True) if db_user else None
+    if USER_CACHE_ENABLED and generation == _user_cache_generation:
+        if user is None:
+            USER_CACHE.set(key, False, ttl=USER_NEGATIVE_TTL)
+        else:
+            for kind in USER_CACHE_KEYS:
+                USER_CACHE.set((kind, getattr(user, kind)), user)
+    return user
+
+def invalidate_cached_users(*users):
+    """Retire du cache les clés des utilisateurs (lignes, copies ou dicts), avant comme après modification"""
+    global _user_cache_generation
+    _user_cache_generation += 1
+    keys = set()
+    for user in users:
+        if user is None:
+            continue
+        for kind in USER_CACHE_KEYS:
+            value = user.get(kind) if isinstance(user, dict) else getattr(user, kind, None)
+            if value is not None:
+                keys.add((kind, value))
+    if keys:
+        USER_CACHE.invalidate(*keys)
+
+def _user_cache_identity(user: models.Users) -> dict:
+    return {kind: getattr(user, kind) for kind in USER_CACHE_KEYS}
+
+# -----------------------------------------------
+def get_cached_user_by_id(db: Session, user_id: int):
+    """Comme get_user_by_id, via USER_CACHE ; retourne une copie détachée (lecture seule)"""
+    found, user = _user_cache_get(("id", user_id))
+    if found:
+        return user
+    generation = _user_cache_generation
+    return _user_cache_set(("id", user_id), get_user_by_id(db, user_id), generation)
+
+def get_cached_user_by_username(db: Session, username: str):
+    found, user = _user_cache_get(("username", username))
+    if found:
+        return user
+    generation = _user_cache_generation
+    return _user_cache_set(("username", username), get_user_by_username(db, username), generation)
+
+def get_cached_user_by_email(db: Session, email: str):
+    found, user = _user_cache_get(("email", email))
+    if found:
+        return user
+    generation = _user_cache_generation
+    return _user_cache_set(("email", email), get_user_by_email(db, email), generation)
+
+async def async_get_cached_user_by_id(db: AsyncSession, user_id: int):
+    found, user = _user_cache_get(("id", user_id))
+    if found:
+        return user
+    generation = _user_cache_generation
+    return _user_cache_set(("id", user_id), await async_get_user_by_id(db, user_id), generation)
+
+async def async_get_cached_user_by_username(db: AsyncSession, username: str):
+    found, user = _user_cache_get(("username", username))
+    if found:
+        return user
+    generation = _user_cache_generation
+    return _user_cache_set(("username", username), await async_get_user_by_username(db, username), generation)
+
+# -----------------------------------------------
+# Résolution groupée : cache d'abord, puis une requête IN (...) par paquet de USER_BATCH_CHUNK valeurs manquantes
+USER_BATCH_CHUNK = utils.BULK.get('get_chunk_size', 500)
+
+async def async_get_users_by_keys(db: AsyncSession, kind: str, values: list) -> dict:
+    """
+    Résout une liste d'ids (kind="id") ou de usernames (kind="username")
+    Retourne {valeur: copie détachée ou None} ; les doublons ne sont lus qu'une fois
+    """
+    column = models.Users.id if kind == "id" else models.Users.username
+    users, missing = {}, []
+    for value in dict.fromkeys(values):
+        found, user = _user_cache_get((kind, value))
+        if found:
+            users[value] = user
+        else:
+            missing.append(value)
+    generation = _user_cache_generation
+    for start in range(0, len(missing), USER_BATCH_CHUNK):
+        chunk = missing[start:start + USER_BATCH_CHUNK]
+        rows = {getattr(row, kind): row for row in (await db.exec(select(models.Users).where(column.in_(chunk)))).all()}
+        for value in chunk:
+            users[value] = _user_cache_set((kind, value), rows.get(value), generation)
+    return users
+
+############### Search #############
+
+# Recherche sur username, full_name et email via l'index FTS5 trigram (database.SEARCH_INDEX) :
+# le coût dépend du nombre de correspondances, pas de la taille de la table.
+# Moins de 3 caractères : pas de trigramme, recherche par préfixe sur les index username / email.
+SEARCH_TRIGRAM = 3
+SEARCH_FTS = sa_table(SEARCH_TABLE, sa_column('rowid'), sa_column('rank'))
+SEARCH_VOCAB = sa_table(f"{SEARCH_TABLE}_vocab", sa_column('term'), sa_column('doc'))
+SEARCH_FUZZY_MAX_SHARE = 0.25
+# En dessous de ce nombre de lignes, un trigramme reste assez sélectif quelle que soit la taille de la table
+SEARCH_FUZZY_MIN_DOCS = 1000
+
+def _fts_phrase(value: str):
+    return '"' + value.replace('"', '""') + '"'
+
+def _like_escape(value: str):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _trigrams(query: str):
+    lowered = query.lower()
+    return sorted({lowered[i:i + SEARCH_TRIGRAM] for i in range(len(lowered) - SEARCH_TRIGRAM + 1)})
+
+def _fuzzy_terms_statement(query: str):
+    # Une recherche d'égalité par trigramme (un IN parcourrait tout le vocabulaire)
+    return union_all(*(select(SEARCH_VOCAB.c.term, SEARCH_VOCAB.c.doc).where(SEARCH_VOCAB.c.term == trigram) for trigram in _trigrams(query)))
+
+def _selective_terms(query: str, frequencies, rows: int):
+    """
+    Moitié la plus rare des trigrammes présents dans l'index, hors trigrammes communs à plus de
+    SEARCH_FUZZY_MAX_SHARE des lignes ("use", "com"...) qui feraient classer toute la table par bm25
+    """
+    limit = max(rows * SEARCH_FUZZY_MAX_SHARE, SEARCH_FUZZY_MIN_DOCS)
+    frequencies = sorted((row for row in frequencies if row[1] <= limit), key=lambda row: row[1])
+    return [term for term, _ in frequencies[:max(1, (len(_trigrams(query)) + 1) // 2)]]
+
+def _case_variants(query: str):
+    variants = {''}
+    for char in query:
+        variants = {variant + case for variant in variants for case in {char.lower(), char.upper()}}
+    return sorted(variants)
+
+def _search_statement(query: str, mode: str, after: int | None, limit: int, fuzzy_terms=None):
+    Users = models.Users
+    key = Users.id
+    if not SEARCH_INDEX:
+        # Repli sans index (autre base que SQLite) : LIKE insensible à la casse
+        pattern = f"{_like_escape(query)}%" if mode == "prefix" else f"%{_like_escape(query)}%"
+        statement = select(Users).where(or_(
+            Users.username.ilike(pattern, escape='\\'), Users.full_name.ilike(pattern, escape='\\'), Users.email.ilike(pattern, escape='\\')
+        ))
+    elif len(query) < SEARCH_TRIGRAM:
+        # Trop court pour l'index trigramme : préfixe sur les index username et email (pas full_name),
+        # une plage par variante de casse ("ad", "Ad", "aD", "AD") pour rester insensible à la casse
+        statement = select(Users).where(or_(*(
+            and_(column >= variant, column < variant + '\U0010ffff')
+            for variant in _case_variants(query) for column in (Users.username, Users.email)
+        )))
+    elif mode == "fuzzy":
+        # Au moins un trigramme sélectif en commun, les plus proches d'abord (bm25)
+        match = " OR ".join(_fts_phrase(term) for term in fuzzy_terms)
+        return (
+            select(Users).join(SEARCH_FTS, SEARCH_FTS.c.rowid == Users.id)
+            .where(sa_text(f"{SEARCH_TABLE} MATCH :match").bindparams(match=match))
+            .order_by(SEARCH_FTS.c.rank, Users.id).offset(after or 0).limit(limit)
+        )
+    else:
+        # Tri et curseur sur le rowid de l'index : FTS5 renvoie les correspondances déjà ordonnées
+        key = SEARCH_FTS.c.rowid
+        statement = (
+            select(Users).join(SEARCH_FTS, SEARCH_FTS.c.rowid == Users.id)
+            .where(sa_text(f"{SEARCH_TABLE} MATCH :match").bindparams(match=_fts_phrase(query)))
+        )
+        if mode == "prefix":
+            pattern = f"{_like_escape(query)}%"
+            statement = statement.where(or_(
+                Users.username.like(pattern, escape='\\'), Users.full_name.like(pattern, escape='\\'), Users.email.like(pattern, escape='\\')
+            ))
+    if after is not None:
+        statement = statement.where(key > after)
+    return statement.order_by(key).limit(limit)
+
+async def async_search_users(db: AsyncSession, query: str, mode: str = "contains", after: int | None = None, limit: int = 20):
+    """
+    Utilisateurs dont username, full_name ou email commence par (prefix), contient (contains)
+    ou ressemble à (fuzzy) `query`. `after` : dernier id renvoyé, ou position pour fuzzy (tri par pertinence)
+    """
+    fuzzy_terms = None
+    if SEARCH_INDEX and mode == "fuzzy" and len(query) >= SEARCH_TRIGRAM:
+        frequencies = await db.exec(_fuzzy_terms_statement(query))
+        # max(id) : estimation instantanée du nombre de lignes (count(*) parcourrait la table)
+        rows = (await db.exec(select(func.max(models.Users.id)))).one() or 0
+        fuzzy_terms = _selective_terms(query, frequencies.all(), rows)
+        if not fuzzy_terms:
+            return []
+    results = await db.exec(_search_statement(query, mode, after, limit, fuzzy_terms))
+    return results.all()
+
 def build_user_read(user: models.Users):
     return schemas.UserRead(
         id=user.id,
@@ -138,37 +609,262 @@ def create_user(db: Session, user):
         is_visible=True
     )
     db.add(db_user)
+    # flush : l'id est attribué avant l'écriture du journal, dans la même transaction
+    db.flush()
+    changes.record_change(db, "create", db_user)
     db.commit()
     db.refresh(db_user)
+    # Absences mises en cache pour ce username / email / id
+    invalidate_cached_users(db_user)
+    changes.notify()
     return build_user_read(db_user)
 
+async def _async_insert_users(db: AsyncSession, values: list) -> dict:
+    """
+    Insère les lignes et ajoute leurs entrées au journal des modifications, dans la transaction en cours
+    (commit à l'appelant) ; retourne {username: id}
+    """
+    if _supports_returning(db, "insert"):
+        ids = {username: user_id for user_id, username in (await db.exec(insert(models.Users).returning(models.Users.id, models.Users.username), params=values)).all()}
+    else:
+        await db.exec(insert(models.Users), params=values)
+        statement = select(models.Users.username, models.Users.id).where(models.Users.username.in_([value['username'] for value in values]))
+        ids = dict((await db.exec(statement)).all())
+    for value in values:
+        changes.record_change(db, "create", SimpleNamespace(**value, id=ids[value['username']], image_url=None, arrival=None))
+    return ids
+
+async def async_bulk_create_users(db: AsyncSession, rows: list, seen_usernames: set, seen_emails: set):
+    """
+    Crée un lot d'utilisateurs en une transaction
+    rows : liste de (numéro de ligne, dict username/email/password/full_name) déjà validés
+    seen_usernames / seen_emails : valeurs déjà traitées dans l'import, pour les doublons entre lots
+    Retourne un résultat par ligne, dans l'ordre reçu
+    """
+    results = {}
+    usernames = [row['username'] for _, row in rows]
+    emails = [row['email'] for _, row in rows]
+
+    # Doublons en base : une seule requête ensembliste par lot
+    statement = select(models.Users.username, models.Users.email).where(or_(models.Users.username.in_(usernames), models.Users.email.in_(emails)))
+    existing = (await db.exec(statement)).all()
+    existing_usernames = {username for username, _ in existing}
+    existing_emails = {email for _, email in existing}
+
+    accepted = []
+    for row_number, row in rows:
+        if row['username'] in existing_usernames or row['username'] in seen_usernames:
+            results[row_number] = {"row": row_number, "username": row['username'], "status": "error", "detail": "Nom d'utilisateur déjà utilisé"}
+        elif row['email'] in existing_emails or row['email'] in seen_emails:
+            results[row_number] = {"row": row_number, "username": row['username'], "status": "error", "detail": "Email déjà utilisé"}
+        else:
+            seen_usernames.add(row['username'])
+            seen_emails.add(row['email'])
+            accepted.append((row_number, row))
+
+    # Hachage en parallèle dans le pool, par fenêtres de la taille du pool pour ne pas le saturer
+    hashes = []
+    window = hashing.POOL.workers
+    try:
+        for start in range(0, len(accepted), window):
+            hashes.extend(await asyncio.gather(*(hashing.hash_password_async(row['password']) for _, row in accepted[start:start + window])))
+    except hashing.HashingPoolBusy:
+        # Pool saturé (connexions concurrentes) : les lots précédents sont enregistrés, ce lot est rejeté ligne par ligne
+        # plutôt qu'un 503 qui perdrait leurs résultats ; les valeurs sont libérées pour un nouvel envoi des mêmes lignes
+        for row_number, row in accepted:
+            seen_usernames.discard(row['username'])
+            seen_emails.discard(row['email'])
+            results[row_number] = {"row": row_number, "username": row['username'], "status": "error", "detail": "Service temporairement surchargé"}
+        accepted = []
+
+    now = dt.datetime.now()
+    values = [
+        {
+            "username": row['username'],
+            "full_name": row.get('full_name') or row['username'],
+            "email": row['email'],
+            "hashed_password": hashed_password,
+            "is_admin": False,
+            "is_disabled": False,
+            "is_visible": True,
+            "created_at": now,
+        }
+        for (_, row), hashed_password in zip(accepted, hashes)
+    ]
+    if values:
+        # Utilisateurs et entrées du journal dans la même transaction : un seul commit par lot
+        try:
+            ids = await _async_insert_users(db, values)
+            await db.commit()
+            inserted = [True] * len(values)
+        except IntegrityError:
+            # Conflit concurrent (autre import, autre worker) : repli ligne par ligne pour isoler les fautives
+            await db.rollback()
+            ids, inserted = {}, []
+            for value in values:
+                try:
+                    row_ids = await _async_insert_users(db, [value])
+                    await db.commit()
+                    ids.update(row_ids)
+                    inserted.append(True)
+                except IntegrityError:
+                    await db.rollback()
+                    inserted.append(False)
+
+        invalidate_cached_users(*[{"id": ids.get(value['username']), "username": value['username'], "email": value['email']} for value, ok in zip(values, inserted) if ok])
+        if ids:
+            changes.notify()
+        for (row_number, row), ok in zip(accepted, inserted):
+            if ok:
+                results[row_number] = {"row": row_number, "username": row['username'], "status": "created", "id": ids.get(row['username'])}
+            else:
+                results[row_number] = {"row": row_number, "username": row['username'], "status": "error", "detail": "Nom d'utilisateur ou email déjà utilisé"}
+
+    return [results[row_number] for row_number, _ in rows]
+
+# Colonnes renvoyées par les écritures (RETURNING) : celles de la réponse, et la révision pour l'ETag
+USER_RETURNING = tuple(models.Users.__table__.c[name] for name in (*schemas.UserRead.model_fields, 'revision'))
+
+def _supports_returning(db, kind: str) -> bool:
+    """UPDATE / DELETE ... RETURNING (SQLite >= 3.35, PostgreSQL) ; sinon une requête de relecture"""
+    return getattr(db.get_bind().dialect, f"{kind}_returning", False)
+
+def _user_update_values(user_update: schemas.UserUpdate, hashed_password: str | None = None) -> dict:
+    values = {field: value for field, value in user_update.model_dump(exclude={'password'}).items() if value is not None}
+    if user_update.password is not None:
+        values['hashed_password'] = hashed_password or hash_password(user_update.password)
+    # Incrémentée dans l'UPDATE lui-même : pas de perte entre écritures concurrentes
+    values['revision'] = models.Users.revision + 1
+    return values
+
+def _bump_revision(user: models.Users):
+    """Incrémente la révision d'une ligne chargée, au prochain flush (revision = revision + 1)"""
+    user.revision = models.Users.revision + 1
+
+def _changes_identity(user_update: schemas.UserUpdate):
+    """Username ou email modifiés : les anciennes valeurs (clés du cache, sessions) doivent être lues avant l'UPDATE"""
+    return user_update.username is not None or user_update.email is not None
+
+def _revokes_sessions(user_update: schemas.UserUpdate):
+    """Les jetons embarquent username et droits : ils sont révoqués quand ces champs (ou le mot de passe) changent"""
+    return any(value is not None for value in (user_update.username, user_update.password, user_update.is_admin, user_update.is_disabled))
+
+def _after_user_update(previous, user, user_update: schemas.UserUpdate):
+    secu_invalidate_principal(previous.username, user.username)
+    invalidate_cached_users(previous, user)
+    changes.notify()
+    if user_update.is_admin is not None or user_update.is_disabled is not None:
+        invalidate_admin_presence()
+
+def _identity_statement(user_id: int):
+    return select(models.Users.id, models.Users.username, models.Users.email).where(models.Users.id == user_id)
+
 def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
-    user = get_user_by_id(db, user_id)
-    if not user:
+    """
+    Mise à jour partielle en une requête : UPDATE users SET ... WHERE id = ? RETURNING ...
+    Retourne la ligne mise à jour (champs de UserRead et revision), None si l'utilisateur n'existe pas
+    Lève IntegrityError si le username ou l'email est déjà utilisé
+    """
+    previous = None
+    if _changes_identity(user_update):
+        previous = db.exec(_identity_statement(user_id)).first()
+        if previous is None:
+            return None
+    statement = update(models.Users).where(models.Users.id == user_id).values(**_user_update_values(user_update))
+    try:
+        if _supports_returning(db, "update"):
+            user = db.exec(statement.returning(*USER_RETURNING)).first()
+        else:
+            user = db.exec(select(*USER_RETURNING).where(models.Users.id == user_id)).first() if db.exec(statement).rowcount else None
+        jtis = []
+        if user is not None:
+            changes.record_change(db, "update", user)
+            if _revokes_sessions(user_update):
+                # Dans la même transaction que la modification : un seul commit
+                jtis = _stage_session_revocation(db, [(previous or user).username])
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise
+    if user is None:
         return None
-    if user_update.username is not None:
-        user.username = user_update.username
-    if user_update.full_name is not None:
-        user.full_name = user_update.full_name
-    if user_update.email is not None:
-        user.email = user_update.email
-    if user_update.password is not None:
-        user.hashed_password = hash_password(user_update.password)
-    if user_update.is_disabled is not None:
-        user.is_disabled = user_update.is_disabled
-    if user_update.is_admin is not None:
-        user.is_admin = user_update.is_admin
-    if user_update.is_visible is not None:
-        user.is_visible = user_update.is_visible
-    db.add(user)
-    db.commit()
-    db.refresh(user)
-    return build_user_read(user)
+    _sessions_revoked(jtis)
+    _after_user_update(previous or user, user, user_update)
+    return user
+
+async def async_update_user(db: AsyncSession, user_id: int, user_update: schemas.UserUpdate):
+    """Version asynchrone de update_user ; le hash du mot de passe est calculé dans le pool dédié"""
+    previous = None
+    if _changes_identity(user_update):
+        previous = (await db.exec(_identity_statement(user_id))).first()
+        if previous is None:
+            return None
+    hashed_password = await hashing.hash_password_async(user_update.password) if user_update.password is not None else None
+    statement = update(models.Users).where(models.Users.id == user_id).values(**_user_update_values(user_update, hashed_password))
+    try:
+        if _supports_returning(db, "update"):
+            user = (await db.exec(statement.returning(*USER_RETURNING))).first()
+        elif (await db.exec(statement)).rowcount:
+            user = (await db.exec(select(*USER_RETURNING).where(models.Users.id == user_id))).first()
+        else:
+            user = None
+        jtis = []
+        if user is not None:
+            changes.record_change(db, "update", user)
+            if _revokes_sessions(user_update):
+                jtis = await _async_stage_session_revocation(db, [(previous or user).username])
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise
+    if user is None:
+        return None
+    _sessions_revoked(jtis)
+    _after_user_update(previous or user, user, user_update)
+    return user
+
+def _after_user_delete(user):
+    secu_invalidate_principal(user.username)
+    invalidate_cached_users(user)
+    invalidate_admin_presence()
+    changes.notify()
 
 def delete_user(db: Session, user_id: int):
-    user = get_user_by_id(db, user_id)
-    if not user:
-        return {"fonction": "delete_user", "erreur": "L'utilisateur n'existe pas"}
-    db.delete(user)
+    """Suppression en une requête : DELETE FROM users WHERE id = ? RETURNING id, username, email"""
+    statement = delete(models.Users).where(models.Users.id == user_id)
+    if _supports_returning(db, "delete"):
+        user = db.exec(statement.returning(models.Users.id, models.Users.username, models.Users.email)).first()
+    else:
+        user = db.exec(_identity_statement(user_id)).first()
+        if user is not None:
+            db.exec(statement)
+    jtis = []
+    if user is not None:
+        changes.record_change(db, "delete", user)
+        # Révocation dans la transaction de la suppression : un seul commit
+        jtis = _stage_session_revocation(db, [user.username])
     db.commit()
-    return {"fonction": "delete_user", "resultat": "Utilisateur supprimé"}
\ No newline at end of file
+    if user is None:
+        return {"fonction": "delete_user", "erreur": "L'utilisateur n'existe pas"}
+    _sessions_revoked(jtis)
+    _after_user_delete(user)
+    return {"fonction": "delete_user", "resultat": "Utilisateur supprimé"}
+
+async def async_delete_user(db: AsyncSession, user_id: int):
+    statement = delete(models.Users).where(models.Users.id == user_id)
+    if _supports_returning(db, "delete"):
+        user = (await db.exec(statement.returning(models.Users.id, models.Users.username, models.Users.email))).first()
+    else:
+        user = (await db.exec(_identity_statement(user_id))).first()
+        if user is not None:
+            await db.exec(statement)
+    jtis = []
+    if user is not None:
+        changes.record_change(db, "delete", user)
+        jtis = await _async_stage_session_revocation(db, [user.username])
+    await db.commit()
+    if user is None:
+        return {"fonction": "delete_user", "erreur": "L'utilisateur n'existe pas"}
+    _sessions_revoked(jtis)
+    _after_user_delete(user)
+    return {"fonction": "delete_user", "resultat": "Utilisateur supprimé"}
@@ -1,12 +1,227 @@
+import hashlib, json, logging, os, re, sys, tempfile, time
+from contextvars import ContextVar
+from functools import lru_cache
+
 from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from . import utils
+from .filelock import FileLock
+
+DATABASE_URL = utils.DATABASE.get('url') or f"sqlite:///./{utils.DATABASE['name']}.db"
+
+# Pragmas SQLite appliqués à chaque connexion : WAL permet des lectures concurrentes pendant une écriture,
+# busy_timeout fait attendre un écrivain au lieu de lever "database is locked"
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 268435456,
+    'cache_size': -64000,
+    'busy_timeout': 5000,
+}
+
+# Pilotes asynchrones utilisés quand l'URL asynchrone n'est pas fournie explicitement
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+}
+
+def _async_url(url: str) -> str:
+    """Convertit une URL synchrone (sqlite:///, postgresql://...) vers son équivalent asynchrone"""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"Aucun pilote asynchrone connu pour '{url.drivername}', renseignez database.async_url")
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = utils.DATABASE.get('async_url') or _async_url(DATABASE_URL)
+
+def _is_memory_sqlite(url: str) -> bool:
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+def _engine_options(url: str) -> dict:
+    """Options du pool de connexions lues depuis config.json (section database)"""
+    # Pas d'echo : les requêtes SQL sont tracées par le mode diagnostic (database.diagnostics)
+    options = {}
+    # SQLite en mémoire utilise un pool spécifique (une connexion par thread), sans dimensionnement
+    if _is_memory_sqlite(url):
+        return options
+    options.update(
+        pool_size=utils.DATABASE.get('pool_size', 5),
+        max_overflow=utils.DATABASE.get('max_overflow', 10),
+        pool_recycle=utils.DATABASE.get('pool_recycle', 1800),
+        pool_pre_ping=utils.DATABASE.get('pool_pre_ping', True),
+    )
+    return options
+
+def _sqlite_pragmas() -> list:
+    pragmas = {**SQLITE_PRAGMAS, **utils.DATABASE.get('sqlite', {})}
+    statements = []
+    for name, value in pragmas.items():
+        if value is None:
+            continue
+        if not name.isidentifier() or not str(value).lstrip('-').isalnum():
+            raise ValueError(f"Pragma SQLite invalide : {name}={value}")
+        statements.append(f"PRAGMA {name}={value}")
+    return statements
 
-DATABASE_URL = f"sqlite:///./{utils.DATABASE['name']}.db"
+def _install_sqlite_pragmas(sync_engine):
+    """Exécute les pragmas à l'ouverture de chaque connexion SQLite (moteurs synchrone et asynchrone)"""
+    if sync_engine.dialect.name != 'sqlite':
+        return
+    statements = _sqlite_pragmas()
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
 
 engine = create_engine(
-    DATABASE_URL, echo=utils.DATABASE['debug']
+    DATABASE_URL, **_engine_options(DATABASE_URL)
+)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL)
+)
+
+_install_sqlite_pragmas(engine)
+_install_sqlite_pragmas(async_engine.sync_engine)
+
+################# Instrumentation #####################
+
+# Statistiques SQL de la requête HTTP en cours (QueryStats), positionnées par api.metrics.MetricsMiddleware.
+# Le contexte suit la requête dans le pool de threads (routes `def`) comme dans le greenlet du moteur asynchrone.
+QUERY_STATS = ContextVar('query_stats', default=None)
+
+# Mode diagnostic (opt-in, section database.diagnostics) : requêtes de chaque requête HTTP regroupées
+# par forme normalisée, détection des formes répétées (N+1) et journal JSON des requêtes lentes.
+# L'ancien `database.debug` active le diagnostic avec le journal de toutes les requêtes.
+DIAGNOSTICS = {
+    'enabled': utils.DATABASE.get('debug', False),
+    'slow_query_ms': 100,
+    'repeat_threshold': 3,
+    'log_statements': utils.DATABASE.get('debug', False),
+    'log_file': '',
+    **utils.DATABASE.get('diagnostics', {}),
+}
+DIAGNOSTICS_ENABLED = bool(DIAGNOSTICS['enabled'])
+SLOW_QUERY_SECONDS = DIAGNOSTICS['slow_query_ms'] / 1000
+REPEAT_THRESHOLD = DIAGNOSTICS['repeat_threshold']
+
+class QueryStats:
+    """Requêtes SQL d'une requête HTTP : nombre, durée cumulée et, en mode diagnostic, détail par forme"""
+    __slots__ = ('count', 'seconds', 'shapes')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        # forme normalisée -> [exécutions, durée cumulée, durée maximale]
+        self.shapes = {} if DIAGNOSTICS_ENABLED else None
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.seconds += elapsed
+        if self.shapes is not None:
+            entry = self.shapes.get(statement)
+            if entry is None:
+                self.shapes[statement] = [1, elapsed, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] = max(entry[2], elapsed)
+
+    def repeated(self) -> dict:
+        """Formes exécutées au moins REPEAT_THRESHOLD fois (boucle de requêtes unitaires, N+1)"""
+        return {shape: entry for shape, entry in self.shapes_by_form().items() if entry[0] >= REPEAT_THRESHOLD}
+
+    def shapes_by_form(self) -> dict:
+        forms = {}
+        for statement, (count, total, longest) in (self.shapes or {}).items():
+            entry = forms.setdefault(normalize_statement(statement), [0, 0.0, 0.0])
+            entry[0] += count
+            entry[1] += total
+            entry[2] = max(entry[2], longest)
+        return forms
+
+_NORMALIZE_RULES = (
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?...)"),
+    (re.compile(r"\s+"), " "),
 )
 
+@lru_cache(maxsize=1024)
+def normalize_statement(statement: str) -> str:
+    """Forme d'une requête : littéraux remplacés par ?, listes IN (?, ?, ...) réduites, espaces compactés"""
+    for pattern, replacement in _NORMALIZE_RULES:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+def _diagnostics_logger() -> logging.Logger:
+    logger = logging.getLogger('api.sql')
+    if DIAGNOSTICS_ENABLED and not logger.handlers:
+        handler = logging.FileHandler(DIAGNOSTICS['log_file'], encoding='utf-8') if DIAGNOSTICS['log_file'] else logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+SQL_LOGGER = _diagnostics_logger()
+
+def _log(event_name: str, **fields):
+    """Une ligne JSON par événement (les paramètres des requêtes ne sont jamais journalisés)"""
+    SQL_LOGGER.info(json.dumps({'ts': round(time.time(), 3), 'event': event_name, **fields}, ensure_ascii=False))
+
+def report_request_queries(stats: QueryStats, label: str):
+    """Fin de requête HTTP en mode diagnostic : formes répétées (N+1) et, si demandé, détail des requêtes"""
+    if not DIAGNOSTICS_ENABLED or not stats.count:
+        return
+    for shape, (count, total, longest) in stats.repeated().items():
+        _log('repeated_query', request=label, statement=shape, count=count,
+             total_ms=round(total * 1000, 3), max_ms=round(longest * 1000, 3))
+    if DIAGNOSTICS['log_statements']:
+        _log('request_queries', request=label, count=stats.count, total_ms=round(stats.seconds * 1000, 3), statements=[
+            {'statement': shape, 'count': count, 'total_ms': round(total * 1000, 3), 'max_ms': round(longest * 1000, 3)}
+            for shape, (count, total, longest) in stats.shapes_by_form().items()
+        ])
+
+def _install_query_stats(sync_engine):
+    """Mesure chaque requête SQL : statistiques de la requête HTTP en cours et journal des requêtes lentes"""
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if DIAGNOSTICS_ENABLED or QUERY_STATS.get() is not None:
+            conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('query_started_at')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        stats = QUERY_STATS.get()
+        if stats is not None:
+            stats.record(statement, elapsed)
+        if DIAGNOSTICS_ENABLED and elapsed >= SLOW_QUERY_SECONDS:
+            _log('slow_query', statement=normalize_statement(statement), duration_ms=round(elapsed * 1000, 3),
+                 executemany=executemany, in_request=stats is not None)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('query_started_at'):
+            connection.info['query_started_at'].pop()
+
+_install_query_stats(engine)
+_install_query_stats(async_engine.sync_engine)
+
 def get_db():
     db = Session(engine)
     try:
@@ -14,26 +229,189 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """Session asynchrone pour les routes `async def` : les requêtes ne bloquent pas la boucle d'événements"""
+    # expire_on_commit=False : pas de rechargement implicite (impossible en asynchrone) après commit
+    async with AsyncSession(async_engine, expire_on_commit=False) as db:
+        yield db
+
+################# Schema #####################
+
+# Empreinte de chaque table de SQLModel.metadata (colonnes, types, nullabilité, défauts, index), stockée
+# dans la table schemafingerprint. Au démarrage, si toutes les empreintes correspondent, aucune inspection
+# n'est faite ; sinon seules les tables modifiées sont comparées à la base. Un verrou fichier garantit
+# qu'un seul worker crée / migre les tables pendant que les autres attendent.
+
+def instance_file(name: str) -> str:
+    """Fichier propre à cette base : à côté du fichier SQLite, sinon dans le répertoire temporaire"""
+    url = make_url(DATABASE_URL)
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+        return f"{url.database}.{name}"
+    return os.path.join(tempfile.gettempdir(), f"api-{hashlib.sha256(DATABASE_URL.encode('utf-8')).hexdigest()[:16]}.{name}")
+
+def _init_lock_path(name: str) -> str:
+    configured = utils.DATABASE.get(f'{name}_lock_file')
+    if configured:
+        return configured
+    return instance_file(f"{name}.lock")
+
+def init_lock(name: str) -> FileLock:
+    """Verrou inter-processus d'une étape d'initialisation (`schema`, `security`) sur cette base"""
+    return FileLock(_init_lock_path(name), timeout=utils.DATABASE.get('lock_timeout', 120))
+
+def schema_lock() -> FileLock:
+    """Verrou inter-processus des opérations sur la structure de la base"""
+    return init_lock('schema')
+
+def _table_fingerprint(table) -> str:
+    columns = []
+    for column in table.columns:
+        default = None
+        if column.default is not None and not callable(column.default.arg):
+            default = repr(column.default.arg)
+        columns.append([column.name, str(column.type.compile(engine.dialect)), column.nullable, column.primary_key, default])
+    indexes = sorted([index.name, [column.name for column in index.columns], bool(index.unique)] for index in table.indexes)
+    payload = json.dumps({'dialect': engine.dialect.name, 'columns': columns, 'indexes': indexes}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def schema_fingerprints() -> dict:
+    """Empreinte attendue de chaque table déclarée dans SQLModel.metadata"""
+    from sqlmodel import SQLModel
+    return {name: _table_fingerprint(table) for name, table in SQLModel.metadata.tables.items()}
+
+def _stored_fingerprints() -> dict:
+    from sqlmodel import select
+    from sqlalchemy.exc import SQLAlchemyError
+    from . import models
+    try:
+        with Session(engine) as db:
+            return {row.table_name: row.fingerprint for row in db.exec(select(models.SchemaFingerprint))}
+    except SQLAlchemyError:
+        # Table pas encore créée
+        return {}
+
+def _store_fingerprints(fingerprints: dict):
+    from sqlmodel import delete
+    from . import models
+    with Session(engine) as db:
+        db.exec(delete(models.SchemaFingerprint))
+        db.add_all(models.SchemaFingerprint(table_name=name, fingerprint=fingerprint) for name, fingerprint in fingerprints.items())
+        db.commit()
+
+################# Search index #####################
+
+# Index de recherche des utilisateurs (SQLite) : table FTS5 à contenu externe avec le tokenizer trigram,
+# tenue à jour par des triggers sur users (toutes les écritures, y compris les imports en masse).
+# Le tokenizer trigram indexe chaque suite de 3 caractères : recherche de sous-chaîne sans parcours de table.
+
+SEARCH_TABLE = 'users_fts'
+
+def _sqlite_trigram_available() -> bool:
+    import sqlite3
+    try:
+        connection = sqlite3.connect(':memory:')
+        try:
+            connection.execute("CREATE VIRTUAL TABLE probe USING fts5(value, tokenize='trigram')")
+        finally:
+            connection.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+# Sans FTS5 trigram (autre base, SQLite < 3.34), la recherche se replie sur des LIKE
+SEARCH_INDEX = engine.dialect.name == 'sqlite' and _sqlite_trigram_available()
+
+SEARCH_INDEX_DDL = (
+    f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(username, full_name, email, content='users', content_rowid='id', tokenize='trigram')",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_ai AFTER INSERT ON users BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, username, full_name, email) VALUES (new.id, new.username, new.full_name, new.email);
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_ad AFTER DELETE ON users BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, username, full_name, email) VALUES ('delete', old.id, old.username, old.full_name, old.email);
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_au AFTER UPDATE OF username, full_name, email ON users BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, username, full_name, email) VALUES ('delete', old.id, old.username, old.full_name, old.email);
+        INSERT INTO {SEARCH_TABLE}(rowid, username, full_name, email) VALUES (new.id, new.username, new.full_name, new.email);
+    END""",
+    # Nombre de lignes par trigramme : la recherche approchée ne garde que les trigrammes les plus sélectifs
+    f"CREATE VIRTUAL TABLE {SEARCH_TABLE}_vocab USING fts5vocab({SEARCH_TABLE}, 'row')",
+    # Indexation des lignes déjà présentes
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')",
+)
+
+def create_search_index():
+    """Crée l'index de recherche et ses triggers s'ils n'existent pas (sans effet hors SQLite)"""
+    if not SEARCH_INDEX:
+        return
+    from sqlalchemy import text
+    with engine.begin() as connection:
+        exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': SEARCH_TABLE}).first()
+        if exists:
+            return
+        for statement in SEARCH_INDEX_DDL:
+            connection.execute(text(statement))
+
+# -----------------------------------------------
 def create_db_and_tables():
     """Crée la base de données et les tables si elles n'existent pas"""
     from sqlmodel import SQLModel
-    SQLModel.metadata.create_all(engine)
+    from . import models  # enregistre les tables dans SQLModel.metadata
+    with schema_lock():
+        SQLModel.metadata.create_all(engine)
+        # create_all ne crée pas les index ajoutés à une table déjà existante : inutile de les
+        # rechercher si la structure n'a pas changé depuis la dernière vérification
+        stored = _stored_fingerprints()
+        for name, fingerprint in schema_fingerprints().items():
+            if stored.get(name) == fingerprint:
+                continue
+            for index in SQLModel.metadata.tables[name].indexes:
+                index.create(engine, checkfirst=True)
+        create_search_index()
 
 def check_database_tables():
     """
     Vérifie et met à jour la structure des tables par rapport aux modèles SQLModel
     Ajoute les nouvelles colonnes si elles sont manquantes
     Vérifie les types de données et signale les incohérences
+    Seules les tables dont l'empreinte a changé depuis la dernière vérification sont inspectées
     """
     from topazdevsdk import colors
-    from sqlalchemy import inspect, text
-    from . import models
-    import inspect as inspect_module
 
     print(f"{colors.BColors.CYAN}Vérification de la structure des tables...{colors.BColors.END}")
     
+    # Empreintes identiques à celles enregistrées : aucune inspection de la base
+    fingerprints = schema_fingerprints()
+    if _stored_fingerprints() == fingerprints:
+        print(f"{colors.BColors.GREEN}Structure des tables inchangée (empreinte identique), vérification ignorée{colors.BColors.END}")
+        return
+    
+    with schema_lock():
+        # Un autre worker a pu faire la vérification pendant l'attente du verrou
+        stored = _stored_fingerprints()
+        if stored == fingerprints:
+            print(f"{colors.BColors.GREEN}Structure des tables vérifiée par un autre processus{colors.BColors.END}")
+            return
+        changed = {name for name, fingerprint in fingerprints.items() if stored.get(name) != fingerprint}
+        if _migrate_tables(changed):
+            _store_fingerprints(fingerprints)
+        else:
+            print(f"{colors.BColors.YELLOW}  ⚠ Empreinte non enregistrée : la vérification sera refaite au prochain démarrage{colors.BColors.END}")
+    
+    print(f"{colors.BColors.GREEN}Vérification des tables terminée{colors.BColors.END}")
+
+
+def _migrate_tables(changed: set) -> bool:
+    """
+    Compare à la base les tables dont l'empreinte a changé, ajoute et corrige les colonnes
+    Retourne False si une correction a échoué
+    """
+    from topazdevsdk import colors
+    from sqlalchemy import inspect, text
+    from . import models
+
     inspector = inspect(engine)
     existing_tables = inspector.get_table_names()
+    complete = True
     
     # Découvrir dynamiquement tous les modèles SQLModel avec une table
     import inspect as inspect_module
@@ -48,6 +426,9 @@ def check_database_tables():
     for model_class in model_classes:
         # Obtenir le nom de la table à partir du modèle SQLModel
         table_name = model_class.__tablename__
+        if table_name not in changed:
+            print(f"{colors.BColors.GREEN}  ✓ Table '{table_name}' inchangée{colors.BColors.END}")
+            continue
         print(f"{colors.BColors.YELLOW}  Vérification de la table '{table_name}'...{colors.BColors.END}")
         
         # Si la table n'existe pas encore, elle sera créée par SQLModel
@@ -91,6 +472,7 @@ def check_database_tables():
                         print(f"{colors.BColors.GREEN}  ✓ Colonne '{column_name}' ajoutée à '{table_name}'{colors.BColors.END}")
                     except Exception as e:
                         print(f"{colors.BColors.YELLOW}  ⚠ Impossible d'ajouter '{column_name}': {str(e)}{colors.BColors.END}")
+                        complete = False
                 else:
                     # COLONNE EXISTE - Vérifier le type de données
                     existing_col = existing_columns[column_name]
@@ -153,8 +535,9 @@ def check_database_tables():
                             print(f"{colors.BColors.GREEN}  ✓ Colonne '{column_name}' corrigée : {col_type} {nullable}{colors.BColors.END}")
                         except Exception as e:
                             print(f"{colors.BColors.YELLOW}  ⚠ Impossible de corriger '{column_name}': {str(e)}{colors.BColors.END}")
+                            complete = False
     
-    print(f"{colors.BColors.GREEN}Vérification des tables terminée{colors.BColors.END}")
+    return complete
 
 
 def _normalize_sql_type(sql_type: str) -> str:
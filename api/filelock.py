@@ -0,0 +1,74 @@
+import os, time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+################# File lock #####################
+
+# Verrou exclusif inter-processus (workers uvicorn d'une même machine) posé sur un fichier :
+# fcntl.flock sous Linux / macOS, msvcrt.locking sous Windows. Le verrou est libéré par le système
+# si le processus meurt. Il ne synchronise pas des machines différentes partageant la même base.
+
+class FileLock:
+    """
+    Verrou exclusif sur `path`, utilisable comme gestionnaire de contexte
+    acquire() attend au plus `timeout` secondes (None : sans limite) puis lève TimeoutError
+    """
+
+    def __init__(self, path: str, timeout: float | None = None, poll_interval: float = 0.05):
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._handle = None
+
+    # -----------------------------------------------
+    def _try_lock(self) -> bool:
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self._handle.seek(0)
+                msvcrt.locking(self._handle.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self) -> bool:
+        """Retourne True si le verrou a été obtenu immédiatement, False s'il a fallu attendre"""
+        if self._handle is not None:
+            raise RuntimeError(f"Verrou déjà détenu : {self.path}")
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._handle = open(self.path, 'a+')
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        waited = False
+        while not self._try_lock():
+            if deadline is not None and time.monotonic() >= deadline:
+                self._handle.close()
+                self._handle = None
+                raise TimeoutError(f"Verrou non obtenu après {self.timeout} s : {self.path}")
+            waited = True
+            time.sleep(self.poll_interval)
+        return not waited
+
+    def release(self):
+        if self._handle is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._handle.fileno(), fcntl.LOCK_UN)
+            else:
+                self._handle.seek(0)
+                msvcrt.locking(self._handle.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._handle.close()
+            self._handle = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.release()
@@ -0,0 +1,165 @@
+import asyncio, base64, hashlib, hmac, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import utils
+
+################# Password hashing #####################
+
+# Format stocké : "<algorithme>$<paramètres>$<sel>$<hash>" (sel et hash en base64)
+#   scrypt$16384$8$1$<sel>$<hash>
+#   pbkdf2_sha256$600000$<sel>$<hash>
+# Les anciens hash SHA-256 (64 caractères hexadécimaux, sans sel) restent vérifiables
+# et sont remplacés au prochain login réussi (voir needs_rehash).
+
+SCRYPT_DEFAULTS = {"n": 16384, "r": 8, "p": 1}
+PBKDF2_DEFAULTS = {"iterations": 600000}
+SALT_SIZE = 16
+KEY_SIZE = 32
+
+ALGORITHM = utils.PASSWORD_HASHING.get('algorithm', 'scrypt')
+SCRYPT = {**SCRYPT_DEFAULTS, **utils.PASSWORD_HASHING.get('scrypt', {})}
+PBKDF2 = {**PBKDF2_DEFAULTS, **utils.PASSWORD_HASHING.get('pbkdf2', {})}
+WORKERS = utils.PASSWORD_HASHING.get('workers', min(4, os.cpu_count() or 1))
+MAX_PENDING = utils.PASSWORD_HASHING.get('max_pending', 64)
+
+class HashingPoolBusy(Exception):
+    """Trop de calculs de hash en attente : la requête doit être rejetée (503) plutôt que mise en file"""
+
+# -----------------------------------------------
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+def _b64decode(data: str) -> bytes:
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # maxmem : la mémoire requise par scrypt (128 * r * (n + p + 2) octets) plus une marge
+    maxmem = 128 * r * (n + p + 2) + 1024 * 1024
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=KEY_SIZE)
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations, dklen=KEY_SIZE)
+
+def _hash(password: str) -> str:
+    salt = os.urandom(SALT_SIZE)
+    if ALGORITHM == 'pbkdf2_sha256':
+        iterations = int(PBKDF2['iterations'])
+        return f"pbkdf2_sha256${iterations}${_b64encode(salt)}${_b64encode(_pbkdf2(password, salt, iterations))}"
+    if ALGORITHM == 'scrypt':
+        n, r, p = int(SCRYPT['n']), int(SCRYPT['r']), int(SCRYPT['p'])
+        return f"scrypt${n}${r}${p}${_b64encode(salt)}${_b64encode(_scrypt(password, salt, n, r, p))}"
+    raise ValueError(f"Algorithme de hachage inconnu : {ALGORITHM}")
+
+def _verify(password: str, hashed: str):
+    """Retourne (mot de passe valide, hash à régénérer avec les paramètres actuels)"""
+    if not hashed:
+        return False, False
+    parts = hashed.split('$')
+    try:
+        if parts[0] == 'scrypt' and len(parts) == 6:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            expected = _b64decode(parts[5])
+            ok = hmac.compare_digest(_scrypt(password, _b64decode(parts[4]), n, r, p), expected)
+            current = ALGORITHM == 'scrypt' and (n, r, p) == (int(SCRYPT['n']), int(SCRYPT['r']), int(SCRYPT['p']))
+            return ok, ok and not current
+        if parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+            iterations = int(parts[1])
+            ok = hmac.compare_digest(_pbkdf2(password, _b64decode(parts[2]), iterations), _b64decode(parts[3]))
+            current = ALGORITHM == 'pbkdf2_sha256' and iterations == int(PBKDF2['iterations'])
+            return ok, ok and not current
+    except (ValueError, TypeError):
+        return False, False
+    if len(hashed) == 64:
+        # Ancien format : SHA-256 sans sel
+        ok = hmac.compare_digest(hashlib.sha256(password.encode('utf-8')).hexdigest(), hashed)
+        return ok, ok
+    return False, False
+
+################# Pool #####################
+
+class HashingPool:
+    """
+    Pool de threads borné pour les calculs de hash (hashlib libère le GIL pendant scrypt / PBKDF2)
+    Au-delà de max_pending calculs en attente, les nouvelles demandes sont rejetées (HashingPoolBusy)
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = max(int(workers), 1)
+        self.max_pending = max(int(max_pending), self.workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hashing")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+
+    # -----------------------------------------------
+    def submit(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HashingPoolBusy()
+            self.pending += 1
+        submitted_at = time.perf_counter()
+        try:
+            return self._executor.submit(self._run, submitted_at, fn, *args)
+        except BaseException:
+            with self._lock:
+                self.pending -= 1
+            raise
+
+    def _run(self, submitted_at: float, fn, *args):
+        started_at = time.perf_counter()
+        with self._lock:
+            self.running += 1
+        try:
+            return fn(*args)
+        finally:
+            finished_at = time.perf_counter()
+            wait, run = started_at - submitted_at, finished_at - started_at
+            with self._lock:
+                self.running -= 1
+                self.pending -= 1
+                self.completed += 1
+                self.wait_total += wait
+                self.run_total += run
+                self.wait_max = max(self.wait_max, wait)
+                self.run_max = max(self.run_max, run)
+
+    # -----------------------------------------------
+    def stats(self):
+        with self._lock:
+            completed = self.completed or 1
+            return {
+                "algorithm": ALGORITHM,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "queue_depth": self.pending - self.running,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "wait_avg_ms": round(self.wait_total / completed * 1000, 3),
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+                "run_avg_ms": round(self.run_total / completed * 1000, 3),
+                "run_max_ms": round(self.run_max * 1000, 3),
+            }
+
+POOL = HashingPool(WORKERS, MAX_PENDING)
+
+# -----------------------------------------------
+def hash_password(password: str) -> str:
+    """Version synchrone (scripts, routes `def`) : bloque le thread appelant, pas la boucle d'événements"""
+    return POOL.submit(_hash, password).result()
+
+def verify_password(password: str, hashed: str):
+    return POOL.submit(_verify, password, hashed).result()
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.wrap_future(POOL.submit(_hash, password))
+
+async def verify_password_async(password: str, hashed: str):
+    return await asyncio.wrap_future(POOL.submit(_verify, password, hashed))
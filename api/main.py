@@ -1,52 +1,88 @@
+import time
+_import_started_at = time.perf_counter()
+
+import asyncio, hmac
+from functools import lru_cache
 from typing import Annotated
 from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse, HTMLResponse, FileResponse, Response
-from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
-from fastapi.openapi.docs import get_swagger_ui_html, get_redoc_html
+from fastapi.responses import JSONResponse, HTMLResponse, FileResponse, Response, PlainTextResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from contextlib import asynccontextmanager
 
 from sqlmodel import Session
-from .database import get_db, create_db_and_tables, check_database_tables
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .database import get_async_db, engine, async_engine, create_db_and_tables, check_database_tables
 
 from . import utils
 from topazdevsdk import colors
-from . import schemas, crud, models
+from . import schemas, crud, models, hashing, static, pagecache, metrics, startup, changes, compression, ratelimit
 from .routes_users import router as users_router
 
 
 ################# App Initialization #################
 
-@asynccontextmanager
-async def lifespan(app_: FastAPI):
-    # Démarrage de l'application
-    print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     -------------------")
-    print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     {colors.BColors.PURPLE}{utils.CONFIG['api']['name']}{colors.BColors.END}")
-    print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Version {colors.BColors.LIGHTBLUE}{utils.VERSION}{colors.BColors.END}")
-    print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     -------------------")
-    
+def initialize():
+    """Phases d'initialisation (base, fichiers statiques, sécurité), chacune mesurée dans le profil de démarrage"""
     # Initialisation de la base de données
     print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Initialisation de la base de données...")
-    create_db_and_tables()
+    with startup.phase("create_db_and_tables"):
+        create_db_and_tables()
     print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Base de données initialisée.")
     print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     -------------------")
     
     # Vérification des tables de la base de données existantes par rapport aux modèles
     print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Vérification des tables de la base de données...")
-    check_database_tables()
+    with startup.phase("check_database_tables"):
+        check_database_tables()
     print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Vérification terminée.")
     print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     -------------------")
     
+    # Préparation des fichiers statiques (variantes compressées, noms versionnés)
+    if utils.STATIC.get('precompress', True):
+        print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Préparation des fichiers statiques...")
+        with startup.phase("build_assets"):
+            manifest = static.build_assets()
+        print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Fichiers statiques prêts ({len(manifest)} fichiers).")
+        print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     -------------------")
+    startup.ASSETS_READY.set()
+    
     # Initialisation de la sécurité
     print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Initialisation de la sécurité...")
-    db = next(get_db())
-    result = crud.loadsecurity(db, utils.SECURITY)
+    with startup.phase("loadsecurity"), Session(engine) as db:
+        result = crud.loadsecurity(db, utils.SECURITY)
     print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Sécurité initialisée. Résultat: {result.get('result') if result.get('result') is not None else result.get('erreur', 'Erreur inconnue')}")
     print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     -------------------")
+    
+    # Purge du journal des modifications (entrées plus anciennes que changes.retention_hours)
+    with startup.phase("prune_changes"), Session(engine) as db:
+        changes.prune(db)
+    startup.READY.set()
+
+def initialize_in_background():
+    """Démarrage rapide : une erreur laisse /api/ready à 503 au lieu d'arrêter le serveur"""
+    try:
+        initialize()
+    except Exception as e:
+        print(f"{colors.BColors.RED}ERROR{colors.BColors.END}:    Échec de l'initialisation : {e}")
+
+@asynccontextmanager
+async def lifespan(app_: FastAPI):
+    # Démarrage de l'application
+    print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     -------------------")
+    print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     {colors.BColors.PURPLE}{utils.CONFIG['api']['name']}{colors.BColors.END}")
+    print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Version {colors.BColors.LIGHTBLUE}{utils.VERSION}{colors.BColors.END}")
+    print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     -------------------")
+    
+    # Démarrage rapide : le serveur accepte les connexions pendant l'initialisation (voir /api/ready)
+    initialization = None
+    if startup.FAST_START:
+        print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Démarrage rapide : initialisation en arrière-plan.")
+        initialization = asyncio.create_task(asyncio.to_thread(initialize_in_background))
+    else:
+        initialize()
 
     # Fonctionnement de l'application
     yield
@@ -54,6 +90,10 @@ async def lifespan(app_: FastAPI):
     # Arrêt de l'application
     print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     -------------------")
     print(f"{colors.BColors.GREEN}INFO{colors.BColors.END}:     Arrêt en cours...")
+    if initialization is not None:
+        await initialization
+    await changes.BROADCASTER.stop()
+    await async_engine.dispose()
 
 # Paramétrage de l'application FastAPI
 app = FastAPI(
@@ -63,11 +103,32 @@ app = FastAPI(
     redoc_url=None,
     lifespan=lifespan
 )
+startup.record("import", time.perf_counter() - _import_started_at)
+
+# Compression des réponses (gzip, br / zstd si installés) ; ajoutée avant MetricsMiddleware qui l'englobe
+# et relève son temps CPU
+if compression.ENABLED:
+    app.add_middleware(compression.CompressionMiddleware)
+
+# Contrôle d'admission : seaux par IP / username (429) et plafond de requêtes simultanées (503), avant le routage
+if ratelimit.ENABLED:
+    app.add_middleware(ratelimit.RateLimitMiddleware)
+
+# Latence, statuts et requêtes SQL par route (exposés sur /api/metrics), diagnostic SQL par requête
+if metrics.ENABLED or metrics.DIAGNOSTICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
 
 ################# Templates #################
 
-templates = Jinja2Templates(directory="templates")
-app.mount("/assets", StaticFiles(directory="assets"), name="assets")
+@lru_cache(maxsize=1)
+def get_templates():
+    """Jinja2 n'est importé qu'au rendu de la première page HTML, pas au démarrage"""
+    from fastapi.templating import Jinja2Templates
+    templates = Jinja2Templates(directory="templates")
+    templates.env.globals['asset_url'] = static.asset_url
+    return templates
+
+app.mount("/assets", static.PrecompressedStaticFiles(directory=static.SOURCE_DIR), name="assets")
 
 favicon_path = 'assets/images/favicon.ico'
 @app.get('/favicon.ico', include_in_schema=False)
@@ -81,7 +142,10 @@ async def robots():
 
 @app.get('/sitemap.xml', include_in_schema=False)
 async def sitemap(request: Request):
-    """Generate sitemap.xml dynamically"""
+    """Generate sitemap.xml dynamically (once per base_url, then served from the page cache)"""
+    return await pagecache.cached_page(request, lambda: _render_sitemap(request))
+
+def _render_sitemap(request: Request):
     base_url = str(request.base_url).rstrip('/')
     
     # Define routes with their priority and change frequency
@@ -112,8 +176,8 @@ async def sitemap(request: Request):
 ################# Security #################
 
 # -----------------------------------------------
-@app.post("/token", tags=["Security"])
-async def secu_login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: Session = Depends(get_db)):
+@app.post("/token", tags=["Security"], response_model=schemas.Token)
+async def secu_login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: AsyncSession = Depends(get_async_db)):
     """
     Authentification OAuth2
     """
@@ -128,20 +192,73 @@ async def secu_login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
     #         raise HTTPException(status_code=400, detail="Invalid client_secret")
     
     # Vérifier les credentials de l'utilisateur
-    user_dict = crud.secu_get_user_by_username(db, form_data.username)
+    user_dict = await crud.async_secu_get_user_by_username(db, form_data.username)
     if not user_dict:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     
-    hashed_password = crud.hash_password(form_data.password)
-    if not hashed_password == user_dict.hashed_password:
+    # Vérification dans le pool de hachage : la boucle d'événements reste disponible
+    password_ok, needs_rehash = await hashing.verify_password_async(form_data.password, user_dict.hashed_password)
+    if not password_ok:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
+    if needs_rehash:
+        await crud.async_secu_upgrade_password_hash(db, user_dict, await hashing.hash_password_async(form_data.password))
+
+    # Jeton signé et expirant : les routes protégées le valident sans requête en base
+    return await crud.async_secu_create_session(db, user_dict)
 
-    return {"access_token": user_dict.username, "token_type": "bearer"}
+# -----------------------------------------------
+@app.post("/logout", tags=["Security"])
+async def secu_logout(current_user: Annotated[schemas.Principal, Depends(crud.secu_get_current_user)], db: AsyncSession = Depends(get_async_db)):
+    """
+    Révoque le jeton utilisé pour cette requête
+    """
+    await crud.async_secu_revoke_token(db, current_user.jti)
+    return {"result": "Session révoquée"}
 
 # -----------------------------------------------
 @app.get("/security/me", tags=["Security"])
-async def read_securityusers_me(current_user: Annotated[schemas.Users, Depends(crud.secu_get_current_active_user)], db: Session = Depends(get_db)):
-    return JSONResponse(content=jsonable_encoder(current_user))
+async def read_securityusers_me(current_user: Annotated[schemas.Principal, Depends(crud.secu_get_current_active_user)], db: AsyncSession = Depends(get_async_db)):
+    user = await crud.async_secu_get_profile(db, current_user.username)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials", headers={"WWW-Authenticate": "Bearer"})
+    return JSONResponse(content=jsonable_encoder(user))
+
+# -----------------------------------------------
+@app.get("/security/cache", tags=["Security"])
+async def read_security_cache_stats(current_user: Annotated[schemas.Principal, Depends(crud.secu_get_current_active_user)]):
+    """Statistiques du cache des utilisateurs authentifiés (hits, misses, évictions)"""
+    return JSONResponse(content=jsonable_encoder(crud.PRINCIPAL_CACHE.stats()))
+
+# -----------------------------------------------
+@app.get("/security/cache/users", tags=["Security"])
+async def read_users_cache_stats(current_user: Annotated[schemas.Principal, Depends(crud.secu_get_current_active_user)]):
+    """Statistiques du cache de lecture des utilisateurs (taux de succès, mémoire, backend)"""
+    return JSONResponse(content=jsonable_encoder(crud.USER_CACHE.stats()))
+
+# -----------------------------------------------
+@app.get("/security/changes", tags=["Security"])
+async def read_changes_stats(current_user: Annotated[schemas.Principal, Depends(crud.secu_get_current_active_user)]):
+    """État du diffuseur du journal des modifications (abonnés, dernier numéro lu, lectures)"""
+    return JSONResponse(content=jsonable_encoder(changes.BROADCASTER.stats()))
+
+# -----------------------------------------------
+@app.get("/security/ratelimit", tags=["Security"])
+async def read_ratelimit_stats(current_user: Annotated[schemas.Principal, Depends(crud.secu_get_current_active_user)]):
+    """Limitation de débit : refus par règle, requêtes délestées, requêtes en cours et en attente"""
+    return JSONResponse(content=jsonable_encoder(ratelimit.stats()))
+
+# -----------------------------------------------
+@app.get("/security/hashing", tags=["Security"])
+async def read_security_hashing_stats(current_user: Annotated[schemas.Principal, Depends(crud.secu_get_current_active_user)]):
+    """Statistiques du pool de hachage des mots de passe (file d'attente, latence)"""
+    return JSONResponse(content=jsonable_encoder(hashing.POOL.stats()))
+
+# -----------------------------------------------
+@app.post("/security/config/reload", tags=["Security"])
+async def reload_configuration(current_user: Annotated[schemas.Principal, Depends(crud.secu_get_current_active_user)]):
+    """Relit config.json et vide les caches qui en dépendent (pages rendues)"""
+    utils.reload_config()
+    return {"result": "Configuration rechargée"}
 
 ################# Include Routers #################
 
@@ -151,25 +268,29 @@ app.include_router(users_router)
 
 # -----------------------------------------------
 @app.get("/", response_class=HTMLResponse)
-def html_main(request: Request):
-    return templates.TemplateResponse("landing.html", {
+async def html_main(request: Request):
+    return await pagecache.cached_page(request, lambda: get_templates().TemplateResponse("landing.html", {
         "request": request, 
         "name": utils.CONFIG['api']['name'],
         "version": utils.VERSION, 
         "hostname": utils.HOSTNAME
-    })
+    }))
 
 ################# Docs Routes #################
 
 # -----------------------------------------------
 @app.get("/docs", response_class=HTMLResponse, include_in_schema=False)
 async def custom_swagger_ui_html(request: Request):
+    return await pagecache.cached_page(request, lambda: _render_swagger_ui_html(request))
+
+def _render_swagger_ui_html(request: Request):
+    from fastapi.openapi.docs import get_swagger_ui_html
     swagger_ui = get_swagger_ui_html(
         openapi_url=app.openapi_url,
         title=f"{utils.CONFIG['api']['name']} - Documentation",
-        swagger_favicon_url="/assets/images/favicon.ico"
+        swagger_favicon_url=static.asset_url("images/favicon.ico")
     )
-    return templates.TemplateResponse("docs.html", {
+    return get_templates().TemplateResponse("docs.html", {
         "request": request, 
         "name": utils.CONFIG['api']['name'],
         "version": utils.VERSION,
@@ -180,12 +301,16 @@ async def custom_swagger_ui_html(request: Request):
 # -----------------------------------------------
 @app.get("/redoc", response_class=HTMLResponse, include_in_schema=False)
 async def redoc_html(request: Request):
+    return await pagecache.cached_page(request, lambda: _render_redoc_html(request))
+
+def _render_redoc_html(request: Request):
+    from fastapi.openapi.docs import get_redoc_html
     redoc_ui = get_redoc_html(
         openapi_url=app.openapi_url,
         title=f"{utils.CONFIG['api']['name']} - ReDoc Documentation",
-        redoc_favicon_url="/assets/images/favicon.ico"
+        redoc_favicon_url=static.asset_url("images/favicon.ico")
     )
-    return templates.TemplateResponse("redoc.html", {
+    return get_templates().TemplateResponse("redoc.html", {
         "request": request, 
         "name": utils.CONFIG['api']['name'],
         "version": utils.VERSION,
@@ -201,6 +326,34 @@ def app_version():
     result = {'name': utils.CONFIG['api']['name'], 'version': utils.VERSION, 'version_dev': utils.VERSION_DEV, 'version_short': utils.VERSION_SHORT, 'hostname': utils.HOSTNAME}
     return JSONResponse(content=jsonable_encoder(result))
 
+# -----------------------------------------------
+@app.get("/api/ready", include_in_schema=False)
+async def app_ready():
+    """Sonde de disponibilité : 503 tant que l'initialisation (démarrage rapide) n'est pas terminée"""
+    return JSONResponse(status_code=200 if startup.READY.is_set() else 503, content=startup.profile())
+
+# -----------------------------------------------
+@app.get("/api/metrics", include_in_schema=False)
+async def app_metrics(request: Request):
+    """Métriques au format texte Prometheus (jeton `metrics.token` exigé s'il est configuré)"""
+    if not metrics.ENABLED:
+        raise StarletteHTTPException(status_code=404, detail="Not Found")
+    if metrics.TOKEN and not hmac.compare_digest(request.headers.get('authorization', ''), f"Bearer {metrics.TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+################# Error Handlers #################
+
+# -----------------------------------------------
+@app.exception_handler(hashing.HashingPoolBusy)
+async def hashing_pool_busy_handler(request: Request, exc: hashing.HashingPoolBusy):
+    """Pool de hachage saturé : rejet immédiat plutôt qu'une file d'attente illimitée"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service temporairement surchargé"},
+        headers={"Retry-After": "1"}
+    )
+
 ################# 404 Handler #################
 
 # -----------------------------------------------
@@ -211,7 +364,7 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     if exc.status_code == 404:
         accept_header = request.headers.get("accept", "")
         if "text/html" in accept_header or not request.url.path.startswith("/api"):
-            return templates.TemplateResponse("404.html", {
+            return get_templates().TemplateResponse("404.html", {
                 "request": request,
                 "name": utils.CONFIG['api']['name'],
                 "version": utils.VERSION_SHORT,
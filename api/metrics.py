@@ -0,0 +1,225 @@
+import time
+from bisect import bisect_left
+
+from . import utils, startup, cache, ratelimit
+from .compression import COMPRESSION_STATS, CompressionStats
+from .database import QUERY_STATS, QueryStats, DIAGNOSTICS_ENABLED, report_request_queries
+
+################# Metrics #####################
+
+# Instrumentation des requêtes HTTP, exposée au format texte Prometheus sur /api/metrics :
+#   - http_requests_total{method, route, status}
+#   - http_request_duration_seconds{method, route} (histogramme)
+#   - http_requests_in_progress{method}
+#   - http_request_db_queries / http_request_db_duration_seconds{method, route} (histogrammes par requête)
+#   - http_response_compression_seconds{method, route} (histogramme du temps CPU, réponses compressées seulement)
+#   - http_response_compression_bytes_total{encoding, stage="in"|"out"} (api.compression)
+#   - ratelimit_limited_total{rule, key}, ratelimit_shed_total, ratelimit_in_flight, ratelimit_waiting (api.ratelimit)
+#   - startup_phase_seconds{phase}, startup_ready (api.startup)
+#   - cache_hits_total / cache_misses_total / cache_entries / cache_memory_bytes{cache} (api.cache)
+# Le libellé `route` est le chemin déclaré (/api/users/{user_id}), jamais l'URL brute.
+# Toutes les mises à jour se font dans le thread de la boucle d'événements : pas de verrou.
+
+ENABLED = utils.METRICS.get('enabled', True)
+TOKEN = utils.METRICS.get('token', '')
+BUCKETS = tuple(sorted(utils.METRICS.get('buckets', [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0])))
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+COMPRESSION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+UNMATCHED_ROUTE = "<unmatched>"
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        # Une case par borne, plus +Inf ; cumulées seulement à l'export
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+# -----------------------------------------------
+class Registry:
+    """Compteurs, jauges et histogrammes des requêtes HTTP"""
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.started_at = time.time()
+        self.requests = {}
+        self.in_progress = {}
+        self.durations = {}
+        self.db_queries = {}
+        self.db_durations = {}
+        self.compression = {}
+        self.compression_bytes = {}
+
+    def observe(self, method: str, route: str, status: int, elapsed: float, queries: int, db_time: float, compression: CompressionStats = None):
+        key = (method, route)
+        self.requests[(method, route, status)] = self.requests.get((method, route, status), 0) + 1
+        histogram = self.durations.get(key)
+        if histogram is None:
+            histogram = self.durations[key] = Histogram(self.buckets)
+            self.db_queries[key] = Histogram(QUERY_BUCKETS)
+            self.db_durations[key] = Histogram(self.buckets)
+        histogram.observe(elapsed)
+        self.db_queries[key].observe(queries)
+        self.db_durations[key].observe(db_time)
+        if compression is not None and compression.encoding is not None:
+            histogram = self.compression.get(key)
+            if histogram is None:
+                histogram = self.compression[key] = Histogram(COMPRESSION_BUCKETS)
+            histogram.observe(compression.seconds)
+            for stage, size in (("in", compression.bytes_in), ("out", compression.bytes_out)):
+                self.compression_bytes[(compression.encoding, stage)] = self.compression_bytes.get((compression.encoding, stage), 0) + size
+
+    # -----------------------------------------------
+    def render(self) -> str:
+        lines = [
+            "# HELP process_start_time_seconds Démarrage du processus (epoch)",
+            "# TYPE process_start_time_seconds gauge",
+            f"process_start_time_seconds {self.started_at:.3f}",
+            "# HELP http_requests_total Requêtes HTTP traitées",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), value in sorted(self.requests.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {value}')
+
+        lines += [
+            "# HELP http_requests_in_progress Requêtes HTTP en cours",
+            "# TYPE http_requests_in_progress gauge",
+        ]
+        for method, value in sorted(self.in_progress.items()):
+            lines.append(f'http_requests_in_progress{{method="{method}"}} {value}')
+
+        lines += [
+            "# HELP http_response_compression_bytes_total Octets avant (in) et après (out) compression des réponses",
+            "# TYPE http_response_compression_bytes_total counter",
+        ]
+        for (encoding, stage), value in sorted(self.compression_bytes.items()):
+            lines.append(f'http_response_compression_bytes_total{{encoding="{encoding}",stage="{stage}"}} {value}')
+
+        lines += [
+            "# HELP startup_phase_seconds Durée des phases de démarrage (import, lifespan)",
+            "# TYPE startup_phase_seconds gauge",
+        ]
+        for name, seconds in startup.PHASES.items():
+            lines.append(f'startup_phase_seconds{{phase="{name}"}} {seconds:.6f}')
+        lines += ["# HELP startup_ready Initialisation terminée", "# TYPE startup_ready gauge", f"startup_ready {int(startup.READY.is_set())}"]
+
+        _render_caches(lines)
+        _render_ratelimit(lines)
+        _render_histograms(lines, "http_request_duration_seconds", "Durée des requêtes HTTP", self.durations)
+        _render_histograms(lines, "http_request_db_queries", "Requêtes SQL par requête HTTP", self.db_queries)
+        _render_histograms(lines, "http_request_db_duration_seconds", "Temps SQL par requête HTTP", self.db_durations)
+        _render_histograms(lines, "http_response_compression_seconds", "Temps CPU de compression par réponse compressée", self.compression)
+        return "\n".join(lines) + "\n"
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _render_caches(lines: list):
+    stats = [instance.stats() for instance in cache.CACHES]
+    for name, kind, field, description in (
+        ("cache_hits_total", "counter", "hits", "Lectures servies par le cache"),
+        ("cache_misses_total", "counter", "misses", "Lectures absentes du cache"),
+        ("cache_entries", "gauge", "size", "Entrées en cache"),
+        ("cache_memory_bytes", "gauge", "memory_bytes", "Mémoire approximative du cache (serveur entier pour Redis)"),
+    ):
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        for entry in stats:
+            if entry.get(field) is not None:
+                lines.append(f'{name}{{cache="{_escape(entry["name"])}"}} {entry[field]}')
+
+def _render_ratelimit(lines: list):
+    if not ratelimit.MIDDLEWARES:
+        return
+    middleware = ratelimit.MIDDLEWARES[-1]
+    lines += ["# HELP ratelimit_limited_total Requêtes refusées (429) par règle et clé", "# TYPE ratelimit_limited_total counter"]
+    for (name, kind), value in sorted(middleware.limited.items()):
+        lines.append(f'ratelimit_limited_total{{rule="{_escape(name)}",key="{kind}"}} {value}')
+    lines += [
+        "# HELP ratelimit_shed_total Requêtes délestées par le plafond de concurrence",
+        "# TYPE ratelimit_shed_total counter",
+        f"ratelimit_shed_total {middleware.shed}",
+        "# HELP ratelimit_in_flight Requêtes en cours sous le plafond de concurrence",
+        "# TYPE ratelimit_in_flight gauge",
+        f"ratelimit_in_flight {middleware.limiter.in_flight}",
+        "# HELP ratelimit_waiting Requêtes en attente d'une place",
+        "# TYPE ratelimit_waiting gauge",
+        f"ratelimit_waiting {middleware.limiter.waiting}",
+    ]
+
+def _render_histograms(lines: list, name: str, description: str, histograms: dict):
+    lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+    for (method, route), histogram in sorted(histograms.items()):
+        labels = f'method="{method}",route="{_escape(route)}"'
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+REGISTRY = Registry()
+
+################# Middleware #####################
+
+def _route_label(scope, root_path: str) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Application montée (/assets) : le routeur a prolongé root_path du chemin de montage
+    mount_path = scope.get("root_path", "")[len(root_path):]
+    return mount_path or UNMATCHED_ROUTE
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI pur (pas de BaseHTTPMiddleware : ni tâche ni file supplémentaire par requête)
+    Délimite aussi les requêtes HTTP pour le mode diagnostic SQL (database.diagnostics)
+    """
+
+    def __init__(self, app, registry: Registry = REGISTRY, record: bool = ENABLED):
+        self.app = app
+        self.registry = registry
+        self.record = record
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        registry = self.registry
+        method = scope["method"]
+        root_path = scope.get("root_path", "")
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        query_stats = QueryStats()
+        token = QUERY_STATS.set(query_stats)
+        compression_stats = CompressionStats()
+        compression_token = COMPRESSION_STATS.set(compression_stats)
+        registry.in_progress[method] = registry.in_progress.get(method, 0) + 1
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            registry.in_progress[method] -= 1
+            QUERY_STATS.reset(token)
+            COMPRESSION_STATS.reset(compression_token)
+            route = _route_label(scope, root_path)
+            if self.record:
+                registry.observe(method, route, status, elapsed, query_stats.count, query_stats.seconds, compression_stats)
+            if DIAGNOSTICS_ENABLED:
+                report_request_queries(query_stats, f"{method} {route}")
@@ -1,9 +1,12 @@
 import datetime as dt
-from sqlmodel import SQLModel, Field
+from sqlmodel import SQLModel, Field, Index
 
 ################# Users ########################
 
 class Users(SQLModel, table=True):
+    # Index composite pour la recherche d'administrateurs actifs (crud.has_active_admin)
+    __table_args__ = (Index("ix_users_is_admin_is_disabled", "is_admin", "is_disabled"),)
+
     id: int | None = Field(default=None, primary_key=True)
     username: str = Field(index=True, unique=True)
     full_name: str | None = Field(default=None)
@@ -15,9 +18,39 @@ class Users(SQLModel, table=True):
     is_admin: bool = Field(default=False)
     is_visible: bool = Field(default=True)
     created_at: dt.datetime = Field(default_factory=dt.datetime.now)
+    # Incrémentée à chaque modification (crud.update_user) : base des ETag des routes de lecture
+    revision: int = Field(default=1)
+
+################# Sessions #####################
+
+# Une ligne par jeton émis (access_token = jti du JWT) ; is_revoked marque une déconnexion
+class ActiveSession(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    username: str = Field(index=True)
+    access_token: str = Field(index=True, unique=True)
+    expiry_time: dt.datetime = Field(index=True)
+    is_revoked: bool = Field(default=False)
+
+################# Changes #####################
+
+# Journal des modifications des utilisateurs (api.changes), écrit dans la transaction de chaque écriture.
+# AUTOINCREMENT : les numéros ne sont jamais réutilisés, même après la purge des anciennes entrées
+class UserChange(SQLModel, table=True):
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: int | None = Field(default=None, primary_key=True)
+    user_id: int = Field(index=True)
+    operation: str = Field()
+    username: str = Field()
+    # Représentation JSON de l'utilisateur après la modification (UserRead), absente pour une suppression
+    data: str | None = Field(default=None)
+    changed_at: dt.datetime = Field(default_factory=dt.datetime.now, index=True)
+
+################# Schema #####################
 
-# class ActiveSession(SQLModel, table=True):
-#     id: int | None = Field(default=None, primary_key=True)
-#     username: str = Field(index=True)
-#     access_token: str = Field()
-#     expiry_time: dt.datetime = Field()
\ No newline at end of file
+# Empreinte de la structure attendue de chaque table (database.check_database_tables) :
+# une table dont l'empreinte n'a pas changé n'est pas réinspectée au démarrage
+class SchemaFingerprint(SQLModel, table=True):
+    table_name: str = Field(primary_key=True)
+    fingerprint: str = Field()
+    updated_at: dt.datetime = Field(default_factory=dt.datetime.now)
@@ -0,0 +1,83 @@
+import gzip, hashlib, inspect
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Request
+from starlette.responses import Response
+
+from . import serialization, startup, utils
+from .cache import TTLCache
+from .static import accepted_encodings
+
+################# Page cache #####################
+
+# Pages entièrement statiques à l'exécution (/, /docs, /redoc, /sitemap.xml) : rendues une fois,
+# puis servies depuis la mémoire avec ETag / Last-Modified. Clé : chemin + base_url + encodage.
+# Le cache est vidé à chaque rechargement de la configuration (utils.reload_config).
+# En démarrage rapide, les pages rendues avant la fin de static.build_assets ne sont pas gardées.
+
+GZIP_LEVEL = utils.CACHE.get('pages', {}).get('gzip_level', 6)
+
+PAGE_CACHE = TTLCache(
+    maxsize=utils.CACHE.get('pages', {}).get('maxsize', 256),
+    ttl=utils.CACHE.get('pages', {}).get('ttl', 86400),
+    name="pages"
+)
+
+@dataclass
+class CachedPage:
+    body: bytes
+    status_code: int
+    media_type: str
+    headers: dict
+
+# -----------------------------------------------
+def _not_modified(request: Request, page: CachedPage) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        # Comparaison faible : la page compressée par CompressionMiddleware porte un ETag W/
+        return serialization.etag_matches(if_none_match, page.headers['etag'])
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(page.headers['last-modified'])
+        except (TypeError, ValueError):
+            return False
+    return False
+
+async def cached_page(request: Request, render) -> Response:
+    """
+    Retourne la page depuis le cache, ou appelle render() (fonction ou coroutine retournant une Response)
+    pour la construire ; les octets stockés sont déjà encodés (gzip si accepté par le client)
+    """
+    encoding = 'gzip' if 'gzip' in accepted_encodings(request.headers.get('accept-encoding', '')) else 'identity'
+    key = (request.url.path, str(request.base_url), encoding)
+    page = PAGE_CACHE.get(key)
+    if page is None:
+        # Lu avant le rendu : une page commencée avec l'ancien manifest n'est jamais mise en cache
+        cacheable = startup.ASSETS_READY.is_set()
+        response = render()
+        if inspect.isawaitable(response):
+            response = await response
+        body = response.body
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        headers = {
+            'etag': f'"{digest}-gzip"' if encoding == 'gzip' else f'"{digest}"',
+            'last-modified': formatdate(usegmt=True),
+            'cache-control': 'no-cache',
+            'vary': 'Accept-Encoding',
+        }
+        if encoding == 'gzip':
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+            headers['content-encoding'] = 'gzip'
+        page = CachedPage(body=body, status_code=response.status_code, media_type=response.media_type, headers=headers)
+        if cacheable:
+            PAGE_CACHE.set(key, page)
+
+    if _not_modified(request, page):
+        return Response(status_code=304, headers=page.headers)
+    return Response(content=page.body, status_code=page.status_code, media_type=page.media_type, headers=page.headers)
+
+@utils.on_config_reload
+def invalidate_pages():
+    PAGE_CACHE.clear()
@@ -0,0 +1,346 @@
+import asyncio, math, time
+from collections import OrderedDict, deque
+from urllib.parse import parse_qs
+
+from . import utils, tokens, serialization
+from topazdevsdk import colors
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
+
+################# Rate limit #####################
+
+# Contrôle d'admission, avant le routage :
+#   - seaux à jetons par IP cliente et par username, configurés par route (rate_limit.routes) : 429 + Retry-After ;
+#   - plafond global de requêtes simultanées (max_concurrency) avec une courte file d'attente bornée :
+#     au-delà, la requête est refusée tout de suite (503 + Retry-After) au lieu d'allonger les files.
+# Le username vient du formulaire de /token (corps rejoué ensuite pour la route) ou du jeton Bearer vérifié.
+# Backend "redis" : seaux partagés entre workers (script Lua atomique, module redis) ; en cas d'erreur Redis,
+# les seaux locaux prennent le relais.
+# L'IP est celle vue par le serveur : derrière un proxy, lancer uvicorn avec --proxy-headers.
+
+ENABLED = utils.RATE_LIMIT.get('enabled', True)
+BACKEND = utils.RATE_LIMIT.get('backend', 'memory')
+REDIS_URL = utils.RATE_LIMIT.get('redis_url', 'redis://localhost:6379/0')
+MAX_KEYS = utils.RATE_LIMIT.get('max_keys', 100000)
+MAX_CONCURRENCY = utils.RATE_LIMIT.get('max_concurrency', 256)
+QUEUE_SIZE = utils.RATE_LIMIT.get('queue_size', 64)
+QUEUE_TIMEOUT = utils.RATE_LIMIT.get('queue_timeout', 1.0)
+SHED_STATUS = utils.RATE_LIMIT.get('shed_status', 503)
+SHED_RETRY_AFTER = utils.RATE_LIMIT.get('shed_retry_after', 1)
+# Connexions longues (SSE, long-poll) et routes de supervision : ni seau ni plafond
+EXEMPT = tuple(utils.RATE_LIMIT.get('exempt', ["/api/metrics", "/api/ready", "/api/users/changes", "/assets/"]))
+# Chemin exact, préfixe ("/api/users/*") ou "default" pour les autres routes ; rate : jetons par seconde
+ROUTES = utils.RATE_LIMIT.get('routes', {
+    "/token": {"ip": {"rate": 1.0, "burst": 20}, "username": {"rate": 0.1, "burst": 5}},
+})
+
+FORM_CONTENT_TYPE = b"application/x-www-form-urlencoded"
+FORM_MAX_BYTES = 65536
+USERNAME_MAX_LENGTH = 256
+
+# -----------------------------------------------
+class Rule:
+    __slots__ = ('name', 'limits')
+
+    def __init__(self, name: str, config: dict):
+        self.name = name
+        # (clé : "ip" ou "username", jetons par seconde, capacité du seau)
+        self.limits = tuple((kind, float(limit['rate']), float(limit['burst'])) for kind, limit in config.items() if kind in ("ip", "username"))
+
+    @property
+    def needs_username(self) -> bool:
+        return any(kind == "username" for kind, _, _ in self.limits)
+
+def _compile_rules(routes: dict) -> tuple:
+    """(règles exactes, règles par préfixe du plus long au plus court, règle par défaut) ; "/api/users/*" : préfixe"""
+    exact, prefixes, default = {}, [], None
+    for path, config in routes.items():
+        rule = Rule(path, config)
+        if path == "default":
+            default = rule
+        elif path.endswith("*"):
+            prefixes.append((path[:-1], rule))
+        else:
+            exact[path] = rule
+    prefixes.sort(key=lambda item: -len(item[0]))
+    return exact, tuple(prefixes), default
+
+def match_rule(path: str, rules: tuple):
+    exact, prefixes, default = rules
+    rule = exact.get(path)
+    if rule is not None:
+        return rule
+    for prefix, rule in prefixes:
+        if path.startswith(prefix):
+            return rule
+    return default
+
+################# Buckets #####################
+
+class MemoryBuckets:
+    """Seaux à jetons du processus, LRU borné à max_keys (une clé évincée repart d'un seau plein)"""
+
+    def __init__(self, max_keys: int = MAX_KEYS):
+        self.max_keys = max(int(max_keys), 1)
+        self._buckets = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """Consomme un jeton : 0 si accordé, sinon secondes avant le prochain jeton"""
+        now = time.monotonic()
+        entry = self._buckets.pop(key, None)
+        available = burst if entry is None else min(burst, entry[0] + (now - entry[1]) * rate)
+        if available >= 1:
+            available -= 1
+            wait = 0.0
+        else:
+            wait = (1 - available) / rate
+        self._buckets[key] = (available, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+# Horloge du serveur Redis (TIME) : les workers n'ont pas à être synchronisés ; le résultat est une chaîne
+# (Redis tronque les nombres Lua en entiers)
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local available = tonumber(state[1])
+if available == nil then
+    available = burst
+else
+    available = math.min(burst, available + math.max(0, now - tonumber(state[2])) * rate)
+end
+local wait = 0
+if available >= 1 then
+    available = available - 1
+else
+    wait = (1 - available) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(available), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+class RedisBuckets:
+    """Seaux partagés entre workers ; une erreur Redis bascule sur les seaux locaux (fallback)"""
+
+    def __init__(self, url: str, prefix: str = "api:ratelimit:", timeout: float = 0.2, fallback: MemoryBuckets = None):
+        if redis_asyncio is None:
+            raise RuntimeError("Le module redis n'est pas installé (pip install redis)")
+        self.url = url
+        self.prefix = prefix
+        self.timeout = timeout
+        self.fallback = fallback or MemoryBuckets()
+        self.errors = 0
+        self._loop = None
+        self._script = None
+
+    def _get_script(self):
+        # Client lié à la boucle d'événements : recréé si elle change (tests, rechargement)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            client = redis_asyncio.Redis.from_url(self.url, socket_timeout=self.timeout, socket_connect_timeout=self.timeout)
+            self._script = client.register_script(_TAKE_SCRIPT)
+            self._loop = loop
+        return self._script
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        try:
+            return float(await self._get_script()(keys=[self.prefix + key], args=[rate, burst]))
+        except (redis_asyncio.RedisError, OSError):
+            self.errors += 1
+            return await self.fallback.take(key, rate, burst)
+
+    def __len__(self):
+        return len(self.fallback)
+
+################# Concurrency #####################
+
+class ConcurrencyLimiter:
+    """
+    Plafond de requêtes simultanées, au plus queue_size requêtes en attente d'une place pendant queue_timeout
+    Les places libérées sont cédées directement aux requêtes en attente (ordre d'arrivée)
+    """
+
+    def __init__(self, limit: int = MAX_CONCURRENCY, queue_size: int = QUEUE_SIZE, queue_timeout: float = QUEUE_TIMEOUT):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.peak = 0
+        self._waiters = deque()
+
+    async def acquire(self) -> bool:
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            return True
+        if len(self._waiters) >= self.queue_size or self.queue_timeout <= 0:
+            return False
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            # Place cédée au moment même de l'expiration : elle est à nous
+            return not future.cancelled()
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            if future in self._waiters:
+                self._waiters.remove(future)
+
+    def release(self):
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+################# Middleware #####################
+
+def _client_ip(scope) -> str:
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+def _bearer_username(scope):
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer":
+                return None
+            claims = tokens.decode(token.strip())
+            return claims.get('sub') if claims else None
+    return None
+
+async def _form_username(scope, receive):
+    """username d'un formulaire urlencoded (/token) ; retourne aussi un receive qui rejoue le corps lu"""
+    content_type = b""
+    for name, value in scope["headers"]:
+        if name == b"content-type":
+            content_type = value.split(b";")[0].strip().lower()
+            break
+    if content_type != FORM_CONTENT_TYPE:
+        return None, receive
+
+    messages, size = [], 0
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        size += len(message.get("body", b""))
+        if not message.get("more_body", False) or size > FORM_MAX_BYTES:
+            break
+
+    async def replay():
+        if messages:
+            return messages.pop(0)
+        return await receive()
+
+    if size > FORM_MAX_BYTES:
+        return None, replay
+    body = b"".join(message.get("body", b"") for message in messages if message["type"] == "http.request")
+    usernames = parse_qs(body.decode("latin-1")).get("username")
+    return (usernames[0][:USERNAME_MAX_LENGTH] if usernames else None), replay
+
+async def _reject(send, status: int, retry_after: float, detail: str):
+    body = serialization.dumps({"detail": detail})
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode("ascii")),
+        (b"retry-after", str(max(int(math.ceil(retry_after)), 1)).encode("ascii")),
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+class RateLimitMiddleware:
+    """Middleware ASGI pur ; seaux et plafond sont propres au processus (sauf backend redis pour les seaux)"""
+
+    def __init__(self, app, routes: dict = ROUTES, buckets=None, limiter: ConcurrencyLimiter = None, exempt: tuple = EXEMPT):
+        self.app = app
+        self.rules = _compile_rules(routes)
+        self.buckets = buckets if buckets is not None else BUCKETS
+        self.limiter = limiter if limiter is not None else LIMITER
+        self.exempt = exempt
+        self.limited = {}
+        self.shed = 0
+        MIDDLEWARES.append(self)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        path = scope["path"]
+        if path.startswith(self.exempt):
+            return await self.app(scope, receive, send)
+
+        rule = match_rule(path, self.rules)
+        if rule is not None and rule.limits:
+            username = None
+            if rule.needs_username:
+                username, receive = await _form_username(scope, receive)
+                if username is None:
+                    username = _bearer_username(scope)
+            for kind, rate, burst in rule.limits:
+                value = _client_ip(scope) if kind == "ip" else username
+                if value is None:
+                    continue
+                wait = await self.buckets.take(f"{rule.name}:{kind}:{value}", rate, burst)
+                if wait > 0:
+                    self.limited[(rule.name, kind)] = self.limited.get((rule.name, kind), 0) + 1
+                    return await _reject(send, 429, wait, "Too many requests")
+
+        limiter = self.limiter
+        if limiter.limit <= 0:
+            return await self.app(scope, receive, send)
+        if not await limiter.acquire():
+            self.shed += 1
+            return await _reject(send, SHED_STATUS, SHED_RETRY_AFTER, "Server overloaded")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis" if isinstance(self.buckets, RedisBuckets) else "memory",
+            "keys": len(self.buckets),
+            "redis_errors": getattr(self.buckets, "errors", None),
+            "limited": {f"{name}:{kind}": count for (name, kind), count in sorted(self.limited.items())},
+            "shed": self.shed,
+            "in_flight": self.limiter.in_flight,
+            "peak_in_flight": self.limiter.peak,
+            "waiting": self.limiter.waiting,
+            "max_concurrency": self.limiter.limit,
+        }
+
+def _create_buckets():
+    if BACKEND == "redis":
+        if redis_asyncio is not None:
+            return RedisBuckets(REDIS_URL)
+        print(f"{colors.BColors.YELLOW}WARNING{colors.BColors.END}:  rate_limit.backend = redis mais le module redis n'est pas installé, seaux en mémoire")
+    return MemoryBuckets()
+
+# Instances créées par l'application (api.main), exposées sur /security/ratelimit et /api/metrics
+MIDDLEWARES = []
+BUCKETS = _create_buckets()
+LIMITER = ConcurrencyLimiter()
+
+def stats() -> dict:
+    return MIDDLEWARES[-1].stats() if MIDDLEWARES else {"enabled": False}
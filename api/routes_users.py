@@ -1,105 +1,126 @@
-from typing import List, Annotated
+from typing import List, Annotated, Literal
 from fastapi import Depends
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.exc import IntegrityError
+import json, csv, io
+from collections import deque
+import datetime as dt
 
-from . import crud, schemas, models
-from .database import get_db
+from . import crud, schemas, utils, serialization, changes
+from .database import get_db, get_async_db, engine
 
 # Créer un routeur pour les routes utilisateur
 router = APIRouter(prefix="/api/users", tags=["Users"])
 
 # -----------------------------------------------
 @router.post("/create/", response_model=schemas.UserRead)
-def create_user(current_user: Annotated[schemas.Users, Depends(crud.secu_get_current_active_user)], user: schemas.UserLogin, db: Session = Depends(get_db)):
+def create_user(current_user: Annotated[schemas.Principal, Depends(crud.secu_get_current_active_user)], user: schemas.UserLogin, db: Session = Depends(get_db)):
     """Créer un nouvel utilisateur"""
-    db_user = crud.get_user_by_username(db, username=user.username)
+    db_user = crud.get_cached_user_by_username(db, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Le nom d'utilisateur ou l'email est incorrect")
     
-    db_user = crud.get_user_by_email(db, email=user.email)
+    db_user = crud.get_cached_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Le nom d'utilisateur ou l'email est incorrect")
-    return crud.create_user(db=db, user=user)
+    try:
+        return crud.create_user(db=db, user=user)
+    except IntegrityError:
+        # Création concurrente (autre requête, autre worker) malgré les vérifications
+        raise HTTPException(status_code=400, detail="Le nom d'utilisateur ou l'email est incorrect")
 
 # -----------------------------------------------
 @router.put("/update/{user_id}", response_model=schemas.UserRead)
-async def update_current_user(user_id: int, user_update: schemas.UserUpdate, db: Session = Depends(get_db)):
-    """Mettre à jour un utilisateur (l'utilisateur lui-même ou un admin)"""
-    from sqlmodel import select
-    
-    db_user = crud.get_user_by_id(db, user_id=user_id)
-    if db_user is None:
-        raise HTTPException(status_code=404, detail="User not found")
+@router.patch("/update/{user_id}", response_model=schemas.UserRead)
+async def update_current_user(user_id: int, user_update: schemas.UserUpdate, db: AsyncSession = Depends(get_async_db)):
+    """Mettre à jour un utilisateur (l'utilisateur lui-même ou un admin)
     
+    Mise à jour partielle : seuls les champs fournis sont modifiés, en une requête (UPDATE ... RETURNING).
+    La réponse porte le nouvel ETag de l'utilisateur.
+    """
     # Vérifier qu'il y a au moins un admin (pour permettre les modifications)
-    statement = select(models.Users)
-    all_users = db.exec(statement).all()
-    has_admin = any(u.is_admin and not u.is_disabled for u in all_users)
-    if not has_admin:
+    if not await crud.async_has_active_admin(db):
         raise HTTPException(status_code=403, detail="Accès refusé")
     
-    return crud.update_user(db=db, user_id=user_id, user_update=user_update)
+    try:
+        user = await crud.async_update_user(db=db, user_id=user_id, user_update=user_update)
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Le nom d'utilisateur ou l'email est incorrect")
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return serialization.RawJSONResponse(serialization.encode_user(user), headers={"etag": serialization.user_etag(user)})
 
 # -----------------------------------------------
 @router.delete("/delete/{user_id}", tags=["Users"])
-async def delete_current_user(user_id: int, db: Session = Depends(get_db)):
+async def delete_current_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
     """Supprimer un utilisateur (l'utilisateur lui-même ou un admin)"""
-    from sqlmodel import select
-    
-    db_user = crud.get_user_by_id(db, user_id=user_id)
-    if db_user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    
     # Vérifier qu'il y a au moins un admin (pour permettre les suppressions)
-    statement = select(models.Users)
-    all_users = db.exec(statement).all()
-    has_admin = any(u.is_admin and not u.is_disabled for u in all_users)
-    if not has_admin:
+    if not await crud.async_has_active_admin(db):
         raise HTTPException(status_code=403, detail="Accès refusé")
     
-    return crud.delete_user(db=db, user_id=user_id)
+    result = await crud.async_delete_user(db=db, user_id=user_id)
+    if "erreur" in result:
+        raise HTTPException(status_code=404, detail="User not found")
+    return result
 
 # -----------------------------------------------
 @router.get("/name/{username}/", response_model=schemas.UserRead)
-def read_user_by_username(username: str, db: Session = Depends(get_db)):
-    """Récupérer un utilisateur par nom d'utilisateur"""
-    db_user = crud.get_user_by_username(db, username=username)
+def read_user_by_username(request: Request, username: str, db: Session = Depends(get_db)):
+    """Récupérer un utilisateur par nom d'utilisateur (304 si If-None-Match correspond à l'ETag)"""
+    db_user = crud.get_cached_user_by_username(db, username=username)
     if db_user is None:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
-    return crud.build_user_read(db_user)
+    return serialization.user_response(request, db_user)
 
 # -----------------------------------------------
 @router.get("/id/{user_id}/", response_model=schemas.UserRead)
-def read_user_by_id(user_id: int, db: Session = Depends(get_db)):
-    """Récupérer un utilisateur par ID"""
-    db_user = crud.get_user_by_id(db, user_id=user_id)
+def read_user_by_id(request: Request, user_id: int, db: Session = Depends(get_db)):
+    """Récupérer un utilisateur par ID (304 si If-None-Match correspond à l'ETag)"""
+    db_user = crud.get_cached_user_by_id(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
-    return crud.build_user_read(db_user)
+    return serialization.user_response(request, db_user)
+
+# -----------------------------------------------
+@router.post("/batch")
+async def read_users_batch(batch: schemas.UserBatch, db: AsyncSession = Depends(get_async_db)):
+    """Récupérer plusieurs utilisateurs par ID et/ou nom d'utilisateur en une requête
+    
+    Les résultats suivent l'ordre de la requête (ids puis usernames) ; un utilisateur absent
+    apparaît avec `"found": false` et `"user": null`.
+    """
+    max_keys = utils.BULK.get('get_max_keys', 1000)
+    if len(batch.ids) + len(batch.usernames) > max_keys:
+        raise HTTPException(status_code=413, detail=f"Au plus {max_keys} ids et usernames par requête")
+    
+    users_by_id = await crud.async_get_users_by_keys(db, "id", batch.ids) if batch.ids else {}
+    users_by_username = await crud.async_get_users_by_keys(db, "username", batch.usernames) if batch.usernames else {}
+    results = []
+    for kind, values, users in (("id", batch.ids, users_by_id), ("username", batch.usernames, users_by_username)):
+        for value in values:
+            user = users[value]
+            results.append({kind: value, "found": user is not None, "user": serialization.user_to_dict(user) if user is not None else None})
+    found = sum(1 for result in results if result["found"])
+    return serialization.RawJSONResponse(serialization.dumps({"found": found, "missing": len(results) - found, "results": results}))
 
 # -----------------------------------------------
 @router.get("/get/{user_id}")
-async def get_user_by_id_endpoint(user_id: int, db: Session = Depends(get_db)):
+async def get_user_by_id_endpoint(request: Request, user_id: int, db: AsyncSession = Depends(get_async_db)):
     """Récupérer les informations d'un utilisateur spécifique par ID (admin uniquement)"""
     try:
-        from sqlmodel import select
-        
         # Récupérer l'utilisateur demandé
-        user = crud.get_user_by_id(db, user_id)
+        user = await crud.async_get_cached_user_by_id(db, user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
         # Vérifier qu'il y a au moins un admin
-        statement = select(models.Users)
-        all_users = db.exec(statement).all()
-        has_admin = any(u.is_admin and not u.is_disabled for u in all_users)
-        if not has_admin:
+        if not await crud.async_has_active_admin(db):
             raise HTTPException(status_code=403, detail="Accès refusé")
         
-        return JSONResponse(content=jsonable_encoder(crud.build_user_read(user)))
+        return serialization.user_response(request, user)
     except HTTPException:
         raise
     except Exception as e:
@@ -107,36 +128,338 @@ async def get_user_by_id_endpoint(user_id: int, db: Session = Depends(get_db)):
 
 # -----------------------------------------------
 @router.get("/list", response_model=List[schemas.UserRead])
-async def get_users_list(db: Session = Depends(get_db)):
-    """Récupérer la liste de tous les utilisateurs (admin uniquement)"""
+async def get_users_list(request: Request, limit: int = Query(100, ge=1, le=1000), cursor: str | None = None, db: AsyncSession = Depends(get_async_db)):
+    """Récupérer la liste des utilisateurs page par page (admin uniquement)
+    
+    La page suivante est indiquée par l'en-tête `X-Next-Cursor` (et `Link: rel="next"`)
+    L'ETag couvre la page entière : 304 si aucune de ses lignes n'a changé
+    """
     try:
-        from sqlmodel import select
-        
-        # Récupérer tous les utilisateurs
-        statement = select(models.Users)
-        results = db.exec(statement).all()
-        
         # Vérifier qu'il y a au moins un admin
-        has_admin = any(user.is_admin and not user.is_disabled for user in results)
-        if not has_admin:
+        if not await crud.async_has_active_admin(db):
             raise HTTPException(status_code=403, detail="Accès refusé")
         
-        # Retourner tous les utilisateurs
-        return JSONResponse(content=jsonable_encoder([crud.build_user_read(user) for user in results]))
+        try:
+            after_id = crud.decode_cursor(cursor) if cursor else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Curseur invalide")
+        
+        # Une ligne de plus que demandé pour savoir s'il existe une page suivante
+        results = await crud.async_get_users_after(db, after_id=after_id, limit=limit + 1)
+        headers = {}
+        if len(results) > limit:
+            results = results[:limit]
+            next_cursor = crud.encode_cursor(results[-1].id)
+            next_url = request.url.include_query_params(cursor=next_cursor, limit=limit)
+            headers["X-Next-Cursor"] = next_cursor
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        
+        etag = serialization.users_etag(results, headers.get("X-Next-Cursor", ""))
+        return serialization.conditional_response(request, etag, lambda: serialization.encode_users(results), headers=headers)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=403, detail="Accès refusé")
 
+# -----------------------------------------------
+@router.get("/search", response_model=List[schemas.UserRead])
+async def search_users(
+    request: Request,
+    q: str = Query(min_length=1, max_length=100),
+    mode: Literal["prefix", "contains", "fuzzy"] = "contains",
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Rechercher des utilisateurs par username, nom complet ou email (admin uniquement)
+    
+    - `prefix` : commence par `q` ; `contains` : contient `q` ; `fuzzy` : ressemblance, par pertinence
+    - insensible à la casse ; `contains` et `fuzzy` demandent au moins 3 caractères (422 sinon)
+    - `prefix` avec moins de 3 caractères : username et email seulement (pas le nom complet)
+    
+    La page suivante est indiquée par l'en-tête `X-Next-Cursor` (et `Link: rel="next"`)
+    """
+    # Vérifier qu'il y a au moins un admin
+    if not await crud.async_has_active_admin(db):
+        raise HTTPException(status_code=403, detail="Accès refusé")
+    
+    if mode != "prefix" and len(q) < crud.SEARCH_TRIGRAM:
+        raise HTTPException(status_code=422, detail=f"Le mode {mode} demande au moins {crud.SEARCH_TRIGRAM} caractères (utilisez mode=prefix)")
+    
+    # fuzzy est trié par pertinence : le curseur porte la position, sinon le dernier id
+    cursor_key = "offset" if mode == "fuzzy" else "id"
+    try:
+        after = crud.decode_cursor(cursor, key=cursor_key) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+    
+    results = await crud.async_search_users(db, q, mode=mode, after=after, limit=limit + 1)
+    headers = {}
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = crud.encode_cursor((after or 0) + limit if mode == "fuzzy" else results[-1].id, key=cursor_key)
+        next_url = request.url.include_query_params(cursor=next_cursor, limit=limit)
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    
+    return serialization.RawJSONResponse(serialization.encode_users(results), headers=headers)
+
+# -----------------------------------------------
+@router.get("/changes")
+async def user_changes(
+    request: Request,
+    since: int | None = Query(None, ge=0),
+    timeout: float = Query(25, ge=0, le=60),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Suivre les modifications des utilisateurs (création, modification, suppression) sans relire la liste (admin uniquement)
+    
+    - `Accept: text/event-stream` : flux SSE, un événement `user` par modification (`id:` = numéro de la modification,
+      reprise automatique avec `Last-Event-ID`), puis les modifications en direct
+    - sinon long-poll : répond dès qu'il existe des modifications après `since`, ou après `timeout` secondes
+      avec une liste vide ; `last_id` est le `since` de l'appel suivant. Sans `since` : répond tout de suite avec le dernier numéro
+    
+    410 si `since` est antérieur aux modifications conservées (`changes.retention_hours`) : relire `/api/users/list`
+    """
+    if not await crud.async_has_active_admin(db):
+        raise HTTPException(status_code=403, detail="Accès refusé")
+    # La connexion n'est pas gardée pendant l'attente
+    await db.close()
+    
+    last_event_id = request.headers.get("last-event-id", "")
+    if since is None and last_event_id.isdigit():
+        since = int(last_event_id)
+    
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return StreamingResponse(changes.stream(since), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    
+    if since is None:
+        last_id = await changes.current_id()
+        return serialization.RawJSONResponse(changes.encode_events([], last_id))
+    try:
+        events, last_id = await changes.wait_for_changes(since, timeout)
+    except changes.ChangesExpired:
+        raise HTTPException(status_code=410, detail="Modifications antérieures purgées, relire la liste complète")
+    return serialization.RawJSONResponse(changes.encode_events(events, last_id))
+
+# -----------------------------------------------
+@router.get("/export")
+async def export_users(format: Literal["ndjson", "json", "csv"] = "ndjson", chunk_size: int = Query(500, ge=1, le=10000), db: AsyncSession = Depends(get_async_db)):
+    """Exporter tous les utilisateurs en flux (NDJSON, tableau JSON ou CSV) à mémoire constante (admin uniquement)"""
+    if not await crud.async_has_active_admin(db):
+        raise HTTPException(status_code=403, detail="Accès refusé")
+    
+    return StreamingResponse(_stream_users(format, chunk_size), media_type=EXPORT_MEDIA_TYPES[format])
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "json": "application/json", "csv": "text/csv"}
+EXPORT_FIELDS = serialization.USER_FIELDS
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dt.datetime, dt.date)):
+        return value.isoformat()
+    return value
+
+def _encode_chunk(format: str, users: list, first: bool):
+    if format == "csv":
+        output = io.StringIO()
+        writer = csv.writer(output)
+        for user in users:
+            writer.writerow([_csv_value(value) for value in serialization.user_to_values(user)])
+        return output.getvalue().encode("utf-8")
+    if format == "ndjson":
+        return serialization.encode_users_ndjson(users)
+    return (b"" if first else b",") + serialization.encode_users(users)[1:-1]
+
+def _stream_users(format: str, chunk_size: int):
+    """Générateur de l'export : une session dédiée, les lignes sont envoyées par paquets de chunk_size"""
+    if format == "json":
+        yield b"["
+    elif format == "csv":
+        yield (",".join(EXPORT_FIELDS) + "\r\n").encode("utf-8")
+    first = True
+    with Session(engine) as db:
+        buffer = []
+        for user in crud.iter_users(db, chunk_size=chunk_size):
+            buffer.append(user)
+            if len(buffer) >= chunk_size:
+                yield _encode_chunk(format, buffer, first)
+                first = False
+                buffer = []
+        if buffer:
+            yield _encode_chunk(format, buffer, first)
+    if format == "json":
+        yield b"]"
+
+# -----------------------------------------------
+@router.post("/bulk")
+async def bulk_import_users(current_user: Annotated[schemas.Principal, Depends(crud.secu_get_current_active_user)], request: Request, batch_size: int | None = Query(None, ge=1, le=10000), db: AsyncSession = Depends(get_async_db)):
+    """Créer des utilisateurs en masse depuis un flux NDJSON (application/x-ndjson) ou CSV (text/csv)
+    
+    Champs : username, email, password, full_name (optionnel). Le CSV doit commencer par une ligne d'en-tête.
+    Les lignes sont insérées par lots de `batch_size`, une transaction par lot ; le résultat est donné ligne par ligne.
+    Au-delà de `bulk.max_rows` lignes, la lecture s'arrête : `truncated` vaut true et les lignes suivantes sont ignorées.
+    Si le pool de hachage est saturé, les lignes du lot en cours sont en erreur (« Service temporairement surchargé ») et peuvent être renvoyées.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        format = "csv"
+    elif content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines"):
+        format = "ndjson"
+    else:
+        raise HTTPException(status_code=415, detail="Formats acceptés : application/x-ndjson, text/csv")
+    
+    batch_size = batch_size or utils.BULK.get('batch_size', 1000)
+    max_rows = utils.BULK.get('max_rows', 100000)
+    results, batch = [], []
+    seen_usernames, seen_emails = set(), set()
+    truncated = False
+    async for row_number, row, error in _parse_bulk_rows(request, format):
+        if row_number > max_rows:
+            # Les lots précédents sont déjà enregistrés : lecture arrêtée, résultats des lignes traitées
+            truncated = True
+            break
+        if error:
+            results.append({"row": row_number, "status": "error", "detail": error})
+            continue
+        batch.append((row_number, row))
+        if len(batch) >= batch_size:
+            results.extend(await crud.async_bulk_create_users(db, batch, seen_usernames, seen_emails))
+            batch = []
+    if batch:
+        results.extend(await crud.async_bulk_create_users(db, batch, seen_usernames, seen_emails))
+    
+    results.sort(key=lambda result: result["row"])
+    created = sum(1 for result in results if result["status"] == "created")
+    return serialization.FastJSONResponse(content={"created": created, "errors": len(results) - created, "truncated": truncated, "max_rows": max_rows, "results": results})
+
+# -----------------------------------------------
+@router.get("/bulk")
+async def bulk_export_users(current_user: Annotated[schemas.Principal, Depends(crud.secu_get_current_active_user)], format: Literal["ndjson", "csv"] = "ndjson", chunk_size: int = Query(1000, ge=1, le=10000)):
+    """Exporter tous les utilisateurs en flux, au même format que l'import (NDJSON ou CSV)"""
+    return StreamingResponse(_stream_users(format, chunk_size), media_type=EXPORT_MEDIA_TYPES[format])
+
+async def _iter_body_lines(request: Request):
+    """Découpe le corps de la requête en lignes (octets) au fil de la réception, sans le charger entièrement"""
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r")
+    if pending:
+        yield pending.rstrip(b"\r")
+
+class _LineFeed:
+    """Itérateur alimenté au fil du flux : un seul csv.reader lit les enregistrements, y compris multi-lignes"""
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+def _ends_in_quotes(line: str, inside: bool) -> bool:
+    """Vrai si la ligne se termine dans un champ entre guillemets (l'enregistrement continue à la ligne suivante)"""
+    if not inside and '"' not in line:
+        return False
+    field_start = not inside
+    index, length = 0, len(line)
+    while index < length:
+        char = line[index]
+        if inside:
+            if char == '"':
+                if index + 1 < length and line[index + 1] == '"':
+                    index += 1
+                else:
+                    inside = False
+        elif char == '"' and field_start:
+            inside = True
+        field_start = not inside and char == ','
+        index += 1
+    return inside
+
+async def _iter_csv_records(request: Request):
+    """
+    Produit (enregistrement, erreur) pour chaque enregistrement CSV non vide
+    Un champ entre guillemets peut contenir des retours à la ligne : les lignes physiques sont accumulées
+    jusqu'à la fin de l'enregistrement, puis lues par un csv.reader unique
+    """
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    pending, inside = [], False
+    async for raw_line in _iter_body_lines(request):
+        try:
+            line = raw_line.decode("utf-8")
+        except UnicodeDecodeError:
+            pending, inside = [], False
+            yield None, "Ligne illisible"
+            continue
+        if not pending and not line.strip():
+            continue
+        # Fin de ligne conservée : le lecteur la garde dans les champs multi-lignes
+        pending.append(line + "\n")
+        inside = _ends_in_quotes(line, inside)
+        if inside:
+            continue
+        feed.lines.extend(pending)
+        pending = []
+        try:
+            yield next(reader), None
+        except (csv.Error, StopIteration):
+            feed.lines.clear()
+            yield None, "Ligne illisible"
+    if pending:
+        # Guillemet jamais refermé
+        yield None, "Ligne illisible"
+
+async def _iter_ndjson_records(request: Request):
+    """Produit (objet, erreur) pour chaque ligne NDJSON non vide"""
+    async for raw_line in _iter_body_lines(request):
+        if not raw_line.strip():
+            continue
+        try:
+            yield json.loads(raw_line.decode("utf-8")), None
+        except (UnicodeDecodeError, ValueError):
+            yield None, "Ligne illisible"
+
+async def _parse_bulk_rows(request: Request, format: str):
+    """Produit (numéro de ligne, données, erreur) pour chaque ligne non vide du flux"""
+    header = None
+    row_number = 0
+    records = _iter_csv_records(request) if format == "csv" else _iter_ndjson_records(request)
+    async for record, error in records:
+        if format == "csv" and header is None and error is None:
+            header = [field.strip() for field in record]
+            continue
+        row_number += 1
+        if error is None and format == "csv":
+            record = dict(zip(header, record)) if header is not None else None
+        if error is not None or not isinstance(record, dict):
+            yield row_number, None, "Ligne illisible"
+            continue
+        missing = [field for field in ("username", "email", "password") if not isinstance(record.get(field), str) or not record.get(field)]
+        if missing:
+            yield row_number, None, f"Champs manquants : {', '.join(missing)}"
+            continue
+        full_name = record.get("full_name")
+        yield row_number, {"username": record["username"], "email": record["email"], "password": record["password"], "full_name": full_name if isinstance(full_name, str) else None}, None
+
 # -----------------------------------------------
 @router.get("/me", response_model=schemas.UserRead)
-async def read_current_user(username: str, db: Session = Depends(get_db)):
-    """Récupérer les informations de l'utilisateur par username"""
+async def read_current_user(request: Request, username: str, db: AsyncSession = Depends(get_async_db)):
+    """Récupérer les informations de l'utilisateur par username (304 si If-None-Match correspond à l'ETag)"""
     if not username:
         raise HTTPException(status_code=400, detail="Username required")
     
-    user = crud.get_user_by_username(db, username=username)
+    user = await crud.async_get_cached_user_by_username(db, username=username)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return JSONResponse(content=jsonable_encoder(crud.build_user_read(user)))
+    return serialization.user_response(request, user)
@@ -17,12 +17,28 @@ class Users(BaseModel):
     is_admin: bool | None = None
     is_visible: bool | None = None
     created_at: datetime.datetime | None = None
+    revision: int | None = None
 
-# class ActiveSession(BaseModel):
-#     id: int
-#     username: str
-#     access_token: str
-#     expiry_time: datetime.datetime
+class ActiveSession(BaseModel):
+    id: int
+    username: str
+    access_token: str
+    expiry_time: datetime.datetime
+    is_revoked: bool | None = None
+
+# Utilisateur authentifié, reconstruit à partir des claims du jeton (sans accès à la base)
+class Principal(BaseModel):
+    id: int
+    username: str
+    is_admin: bool
+    is_disabled: bool
+    jti: str
+    expires_at: int
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str
+    expires_in: int
 
 class UserUpdate(BaseModel):
     username: Optional[str] = None
@@ -45,7 +61,16 @@ class UserRead(BaseModel):
     is_visible: bool | None = None
     created_at: datetime.datetime | None = None
 
+# Copie mise en cache par crud (mémoire ou Redis) : champs publics et révision (ETag), jamais le hash du mot de passe
+class CachedUser(UserRead):
+    revision: int | None = None
+
 class UserLogin(BaseModel):
     username: str | None = None
     email: str | None = None
-    password: str
\ No newline at end of file
+    password: str
+
+# Résolution groupée (/api/users/batch) : ids et/ou usernames, résultats dans l'ordre de la requête
+class UserBatch(BaseModel):
+    ids: list[int] = []
+    usernames: list[str] = []
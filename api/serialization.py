@@ -0,0 +1,109 @@
+import datetime as dt
+import hashlib
+import json
+from operator import attrgetter
+
+from fastapi.responses import JSONResponse
+from starlette.responses import Response
+
+from . import schemas
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+################# Serialization #####################
+
+# Sérialisation directe ligne ORM -> octets JSON, sans passer par schemas.UserRead + jsonable_encoder.
+# Les champs sont lus en une fois par un attrgetter précompilé ; orjson (extension C) est utilisé s'il est installé.
+# Les dates restent au format ISO 8601, identique à jsonable_encoder.
+
+USER_FIELDS = tuple(schemas.UserRead.model_fields)
+_user_values = attrgetter(*USER_FIELDS)
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+def _default(value):
+    if isinstance(value, (dt.datetime, dt.date, dt.time)):
+        return value.isoformat()
+    raise TypeError(f"Type non sérialisable : {type(value).__name__}")
+
+if orjson is not None:
+    def dumps(content) -> bytes:
+        return orjson.dumps(content, default=_default)
+else:
+    def dumps(content) -> bytes:
+        return json.dumps(content, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+# -----------------------------------------------
+def user_to_dict(user) -> dict:
+    """Champs de schemas.UserRead lus directement sur la ligne (models.Users ou tout objet équivalent)"""
+    return dict(zip(USER_FIELDS, _user_values(user)))
+
+def user_to_values(user) -> tuple:
+    return _user_values(user)
+
+def encode_user(user) -> bytes:
+    return dumps(user_to_dict(user))
+
+def encode_users(users) -> bytes:
+    return dumps([user_to_dict(user) for user in users])
+
+def encode_users_ndjson(users) -> bytes:
+    return b"".join(dumps(user_to_dict(user)) + b"\n" for user in users)
+
+# -----------------------------------------------
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encodée avec le backend le plus rapide disponible (orjson sinon json)"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+class RawJSONResponse(Response):
+    """Réponse dont le corps JSON est déjà encodé (encode_user, encode_users...)"""
+    media_type = "application/json"
+
+################# ETag #####################
+
+# ETag fort dérivé de la version de la ligne (id, révision, date de création) sans sérialiser la réponse :
+# une lecture dont l'ETag correspond à If-None-Match répond 304 sans corps. La date de création distingue
+# un id réutilisé après suppression. ETAG_VERSION est à incrémenter si la représentation JSON change.
+
+ETAG_VERSION = 1
+CACHE_CONTROL = "private, no-cache"
+
+def _row_version(user) -> str:
+    created_at = user.created_at.isoformat() if user.created_at else ""
+    return f"{user.id}:{user.revision}:{created_at}"
+
+def _etag(payload: str) -> str:
+    return '"' + hashlib.blake2b(f"{ETAG_VERSION}|{payload}".encode('utf-8'), digest_size=8).hexdigest() + '"'
+
+def user_etag(user) -> str:
+    return _etag(_row_version(user))
+
+def users_etag(users, *extra) -> str:
+    """ETag d'une collection : versions des lignes, dans l'ordre, et paramètres de la page (curseur suivant...)"""
+    return _etag(";".join([_row_version(user) for user in users] + [str(value) for value in extra]))
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Comparaison faible (RFC 9110) : un ETag W/"x" du client correspond à "x" """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+
+def conditional_response(request, etag: str, render, headers: dict | None = None) -> Response:
+    """
+    304 sans corps si If-None-Match correspond à `etag`, sinon RawJSONResponse(render())
+    render n'est appelé que si le corps est nécessaire
+    """
+    response_headers = {'etag': etag, 'cache-control': CACHE_CONTROL, **(headers or {})}
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=response_headers)
+    return RawJSONResponse(render(), headers=response_headers)
+
+def user_response(request, user) -> Response:
+    return conditional_response(request, user_etag(user), lambda: encode_user(user))
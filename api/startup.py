@@ -0,0 +1,84 @@
+import asyncio, json, re, subprocess, sys, threading, time
+from contextlib import contextmanager
+
+from . import utils
+
+################# Startup #####################
+
+# Profil de démarrage : durée de l'import de api.main et de chaque phase du lifespan
+# (exposé sur /api/metrics). En démarrage rapide (startup.fast_start), les phases d'initialisation
+# s'exécutent en arrière-plan après le démarrage du serveur ; /api/ready répond 503 tant
+# qu'elles ne sont pas terminées.
+
+FAST_START = utils.STARTUP.get('fast_start', False)
+
+PHASES = {}
+READY = threading.Event()
+# Manifest des fichiers statiques prêt : avant, les pages rendues pointent vers des URLs non versionnées
+# et ne sont pas mises en cache (pagecache)
+ASSETS_READY = threading.Event()
+
+# -----------------------------------------------
+def record(name: str, seconds: float):
+    PHASES[name] = seconds
+
+@contextmanager
+def phase(name: str):
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started_at)
+
+def profile() -> dict:
+    return {
+        "fast_start": FAST_START,
+        "ready": READY.is_set(),
+        "phases_ms": {name: round(seconds * 1000, 3) for name, seconds in PHASES.items()},
+    }
+
+################# Import profile #####################
+
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+def import_profile(module: str = "api.main", top: int = 15) -> dict:
+    """
+    Importe `module` dans un nouvel interpréteur avec -X importtime et résume le résultat :
+    temps propre par paquet de premier niveau et modules les plus coûteux (temps cumulé)
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True
+    ).stderr
+    packages, modules, total = {}, [], 0
+    for line in output.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, name = int(match[1]), int(match[2]), match[3]
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+        modules.append((cumulative_us, name))
+        if name == module:
+            total = cumulative_us
+    modules.sort(reverse=True)
+    return {
+        "module": module,
+        "total_ms": round(total / 1000, 1),
+        "packages_ms": {name: round(us / 1000, 1) for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]},
+        "slowest_modules_ms": {name: round(us / 1000, 1) for us, name in modules[:top]},
+    }
+
+async def _lifespan_profile() -> dict:
+    # Module importé sous son nom (api.startup) : c'est lui que api.main renseigne, pas __main__
+    from . import startup
+    from .main import app
+    async with app.router.lifespan_context(app):
+        while not startup.READY.is_set():
+            await asyncio.sleep(0.01)
+        return startup.profile()
+
+if __name__ == "__main__":
+    result = {"imports": import_profile()}
+    result["lifespan"] = asyncio.run(_lifespan_profile())
+    print(json.dumps(result, indent=2, ensure_ascii=False))
@@ -0,0 +1,177 @@
+import gzip, hashlib, json, mimetypes, os, sys
+
+import anyio
+from fastapi.staticfiles import StaticFiles
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+
+from . import serialization, utils
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+################# Static assets #####################
+
+# Étape de build (au démarrage ou via `python -m api.static`) :
+#   - variantes .gz (et .br si le module brotli est installé) des fichiers compressibles
+#   - manifest.json : empreinte du contenu de chaque fichier et nom versionné (css/main.<hash>.css)
+# Au service, PrecompressedStaticFiles choisit la variante selon Accept-Encoding,
+# envoie un ETag fort et répond 304 aux requêtes conditionnelles.
+
+SOURCE_DIR = utils.STATIC.get('directory', 'assets')
+BUILD_DIR = utils.STATIC.get('build_dir', '.build/assets')
+MAX_AGE = utils.STATIC.get('max_age', 3600)
+IMMUTABLE_MAX_AGE = 31536000
+GZIP_LEVEL = utils.STATIC.get('gzip_level', 9)
+BROTLI_QUALITY = utils.STATIC.get('brotli_quality', 11)
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.ttf', '.otf', '.eot', '.ico', '.map'}
+# Une variante n'est conservée que si elle économise au moins 10 %
+MIN_RATIO = 0.9
+
+MANIFEST_FILE = 'manifest.json'
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+MANIFEST = {}
+HASHED_PATHS = {}
+
+# -----------------------------------------------
+def _hashed_name(path: str, digest: str) -> str:
+    root, extension = os.path.splitext(path)
+    return f"{root}.{digest}{extension}"
+
+def _write_atomic(target: str, data: bytes):
+    """Écriture atomique : plusieurs workers peuvent construire les assets en même temps"""
+    os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+    temporary = f"{target}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as handle:
+        handle.write(data)
+    os.replace(temporary, target)
+
+def build_assets(source: str = SOURCE_DIR, build: str = BUILD_DIR) -> dict:
+    """
+    Construit (de façon incrémentale) les variantes compressées et le manifest des fichiers statiques
+    Un fichier dont la taille et la date de modification n'ont pas changé n'est pas retraité
+    """
+    manifest_path = os.path.join(build, MANIFEST_FILE)
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as handle:
+            previous = json.load(handle)
+
+    manifest = {}
+    for directory, _, files in os.walk(source):
+        for filename in files:
+            full_path = os.path.join(directory, filename)
+            path = os.path.relpath(full_path, source).replace(os.sep, '/')
+            stat_result = os.stat(full_path)
+            entry = previous.get(path)
+            if entry and entry['size'] == stat_result.st_size and entry['mtime'] == stat_result.st_mtime_ns:
+                manifest[path] = entry
+                continue
+
+            with open(full_path, 'rb') as handle:
+                data = handle.read()
+            digest = hashlib.sha256(data).hexdigest()[:16]
+            encodings = []
+            if os.path.splitext(filename)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                variants = {'gzip': gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)}
+                if brotli is not None:
+                    variants['br'] = brotli.compress(data, quality=BROTLI_QUALITY)
+                for encoding, suffix in ENCODINGS:
+                    compressed = variants.get(encoding)
+                    if compressed is not None and len(compressed) < len(data) * MIN_RATIO:
+                        _write_atomic(os.path.join(build, path + suffix), compressed)
+                        encodings.append(encoding)
+            manifest[path] = {
+                'hash': digest,
+                'hashed': _hashed_name(path, digest),
+                'size': stat_result.st_size,
+                'mtime': stat_result.st_mtime_ns,
+                'encodings': encodings,
+            }
+
+    _write_atomic(manifest_path, json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+    load_manifest(build)
+    return manifest
+
+def load_manifest(build: str = BUILD_DIR):
+    """Charge le manifest en mémoire (sans effet s'il n'a pas encore été construit)"""
+    manifest_path = os.path.join(build, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as handle:
+            manifest = json.load(handle)
+    MANIFEST.clear()
+    MANIFEST.update(manifest)
+    HASHED_PATHS.clear()
+    HASHED_PATHS.update({entry['hashed']: path for path, entry in manifest.items()})
+
+def asset_url(path: str) -> str:
+    """URL versionnée d'un fichier statique (fonction Jinja) : /assets/css/main.<hash>.css"""
+    path = path.lstrip('/')
+    entry = MANIFEST.get(path)
+    return f"/assets/{entry['hashed'] if entry else path}"
+
+# -----------------------------------------------
+def accepted_encodings(header: str) -> set:
+    accepted = set()
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles servant les variantes précompressées et les noms versionnés du manifest"""
+
+    def __init__(self, *args, build_dir: str = BUILD_DIR, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.build_dir = build_dir
+
+    async def get_response(self, path: str, scope):
+        path = path.replace(os.sep, '/')
+        original = HASHED_PATHS.get(path)
+        entry = MANIFEST.get(original or path)
+        if entry is None or scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+        original = original or path
+
+        headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope["headers"]}
+        accepted = accepted_encodings(headers.get('accept-encoding', ''))
+        encoding = next((name for name, _ in ENCODINGS if name in entry['encodings'] and name in accepted), None)
+
+        # ETag fort par représentation : la variante compressée n'a pas les mêmes octets que l'originale
+        etag = f'"{entry["hash"]}-{encoding}"' if encoding else f'"{entry["hash"]}"'
+        response_headers = {
+            'etag': etag,
+            'cache-control': f"public, max-age={IMMUTABLE_MAX_AGE}, immutable" if original != path else f"public, max-age={MAX_AGE}",
+        }
+        if entry['encodings']:
+            response_headers['vary'] = 'Accept-Encoding'
+
+        # Comparaison faible : CompressionMiddleware rend l'ETag faible (W/) quand il compresse à la volée
+        if serialization.etag_matches(headers.get('if-none-match'), etag):
+            return Response(status_code=304, headers=response_headers)
+
+        media_type = mimetypes.guess_type(original)[0] or 'application/octet-stream'
+        if encoding:
+            suffix = dict(ENCODINGS)[encoding]
+            response_headers['content-encoding'] = encoding
+            return FileResponse(os.path.join(self.build_dir, original + suffix), media_type=media_type, headers=response_headers)
+        full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, original)
+        if stat_result is None:
+            raise HTTPException(status_code=404)
+        return FileResponse(full_path, stat_result=stat_result, media_type=media_type, headers=response_headers)
+
+if __name__ == "__main__":
+    result = build_assets()
+    compressed = sum(1 for entry in result.values() if entry['encodings'])
+    print(f"{len(result)} fichiers, {compressed} avec variantes compressées -> {BUILD_DIR}", file=sys.stderr)
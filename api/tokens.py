@@ -0,0 +1,139 @@
+import base64, hashlib, hmac, json, os, secrets, threading, time, uuid
+
+from . import utils, database
+from topazdevsdk import colors
+
+################# Access tokens #####################
+
+# Jetons JWT signés HMAC-SHA256 : la validation ne demande que du calcul, sans accès à la base.
+# Claims : sub (username), uid (id), adm (admin), dis (désactivé), jti (identifiant de session), iat, exp
+
+ALGORITHM = "HS256"
+EXPIRE_MINUTES = utils.TOKENS.get('expire_minutes', 60)
+REVOCATION_REFRESH = utils.TOKENS.get('revocation_refresh', 5)
+
+def _load_secret() -> bytes:
+    secret = utils.TOKENS.get('secret', '')
+    if secret:
+        return secret.encode('utf-8')
+    # Sans secret configuré : clé aléatoire générée une fois, partagée par les workers de la machine via un fichier
+    # (jamais dérivée des identifiants : un jeton permettrait de les retrouver hors ligne)
+    path = utils.TOKENS.get('secret_file') or database.instance_file("token_secret")
+    with database.init_lock('token_secret'):
+        if not os.path.exists(path):
+            descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(descriptor, 'w') as handle:
+                handle.write(secrets.token_hex(32))
+            print(f"{colors.BColors.YELLOW}WARNING{colors.BColors.END}:  tokens.secret absent de config.json, clé aléatoire générée dans {path}")
+        with open(path, encoding='utf-8') as handle:
+            key = handle.read().strip()
+    if len(key) < 64:
+        raise RuntimeError(f"Clé de signature des jetons invalide dans {path} : supprimez le fichier ou renseignez tokens.secret")
+    return bytes.fromhex(key)
+
+SECRET = _load_secret()
+
+# -----------------------------------------------
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+_HEADER = _b64encode(json.dumps({"alg": ALGORITHM, "typ": "JWT"}, separators=(',', ':')).encode('utf-8'))
+
+def _sign(signing_input: str) -> str:
+    return _b64encode(hmac.new(SECRET, signing_input.encode('ascii'), hashlib.sha256).digest())
+
+def encode(claims: dict) -> str:
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    signing_input = f"{_HEADER}.{payload}"
+    return f"{signing_input}.{_sign(signing_input)}"
+
+def decode(token: str):
+    """Retourne les claims d'un jeton valide et non expiré, sinon None"""
+    try:
+        header, payload, signature = token.split('.')
+        # L'en-tête doit être exactement celui émis : pas d'algorithme choisi par le client
+        if header != _HEADER:
+            return None
+        if not hmac.compare_digest(signature, _sign(f"{header}.{payload}")):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, AttributeError):
+        return None
+    if not isinstance(claims, dict) or claims.get('exp', 0) <= time.time():
+        return None
+    return claims
+
+def create_access_token(user):
+    """Crée le jeton d'un utilisateur, retourne (jeton, jti, expiration en secondes epoch)"""
+    now = int(time.time())
+    expires_at = now + int(EXPIRE_MINUTES * 60)
+    jti = uuid.uuid4().hex
+    token = encode({
+        "sub": user.username,
+        "uid": user.id,
+        "adm": bool(user.is_admin),
+        "dis": bool(user.is_disabled),
+        "jti": jti,
+        "iat": now,
+        "exp": expires_at,
+    })
+    return token, jti, expires_at
+
+################# Revocation #####################
+
+class RevocationList:
+    """
+    Liste en mémoire des jti révoqués et non expirés (sessions déconnectées)
+    Rechargée depuis la table activesession toutes les `refresh_interval` secondes
+    pour prendre en compte les révocations faites par les autres workers
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self.loaded = False
+        self._jtis = set()
+        self._loaded_at = None
+        # jti ajoutés pendant un rechargement (None hors rechargement) : conservés quand le nouvel ensemble arrive
+        self._added_during_refresh = None
+        self._lock = threading.Lock()
+
+    def begin_refresh(self) -> bool:
+        """Réserve le rechargement : un seul appelant reçoit True par intervalle, et jamais pendant un rechargement"""
+        now = time.monotonic()
+        with self._lock:
+            if self._added_during_refresh is not None:
+                return False
+            if self._loaded_at is not None and now - self._loaded_at < self.refresh_interval:
+                return False
+            self._loaded_at = now
+            self._added_during_refresh = set()
+            return True
+
+    def complete_refresh(self, jtis):
+        with self._lock:
+            self._jtis = set(jtis) | self._added_during_refresh
+            self._added_during_refresh = None
+            self.loaded = True
+
+    def abort_refresh(self):
+        """Rechargement échoué : le prochain appelant réessaie"""
+        with self._lock:
+            self._added_during_refresh = None
+            self._loaded_at = None
+
+    def add(self, *jtis):
+        with self._lock:
+            self._jtis.update(jtis)
+            if self._added_during_refresh is not None:
+                self._added_during_refresh.update(jtis)
+
+    def __contains__(self, jti) -> bool:
+        return jti in self._jtis
+
+    def __len__(self):
+        return len(self._jtis)
+
+REVOCATIONS = RevocationList(REVOCATION_REFRESH)
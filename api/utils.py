@@ -3,7 +3,8 @@ from topazdevsdk import file
 from .version import __version__, __version_dev__, __version_short__
 
 # CONFIGURATION
-path = f"{os.path.realpath(os.path.dirname(__file__))}/../config.json"
+# API_CONFIG : chemin d'un autre fichier de configuration (benchmarks, déploiements multiples)
+path = os.environ.get('API_CONFIG') or f"{os.path.realpath(os.path.dirname(__file__))}/../config.json"
 path_template = f"{os.path.realpath(os.path.dirname(__file__))}/../config.json.template"
 
 HOSTNAME = socket.gethostname()
@@ -19,8 +20,8 @@ if not file.exist(path):
 		data = {}
 	file.json_write(path, data)
 
-if file.exist(f"{os.path.realpath(os.path.dirname(__file__))}/../config.json"):
-	CONFIG = file.json_read('config.json')
+if file.exist(path):
+	CONFIG = file.json_read(path)
 	SECURITY = CONFIG['security']
 	DATABASE = CONFIG['database']
 	API_IP = CONFIG['api']['ip']
@@ -28,6 +29,16 @@ if file.exist(f"{os.path.realpath(os.path.dirname(__file__))}/../config.json"):
 	OAUTH2 = CONFIG.get('oauth2', {})
 	CLIENT_ID = OAUTH2.get('client_id', '')
 	CLIENT_SECRET = OAUTH2.get('client_secret', '')
+	CACHE = CONFIG.get('cache', {})
+	PASSWORD_HASHING = CONFIG.get('password_hashing', {})
+	TOKENS = CONFIG.get('tokens', {})
+	BULK = CONFIG.get('bulk', {})
+	STATIC = CONFIG.get('static', {})
+	METRICS = CONFIG.get('metrics', {})
+	STARTUP = CONFIG.get('startup', {})
+	CHANGES = CONFIG.get('changes', {})
+	COMPRESSION = CONFIG.get('compression', {})
+	RATE_LIMIT = CONFIG.get('rate_limit', {})
 else:
 	DATABASE = {"name": "database", "debug": True}
 	API_IP = "127.0.0.1"
@@ -37,3 +48,34 @@ else:
 	OAUTH2 = {}
 	CLIENT_ID = ''
 	CLIENT_SECRET = ''
+	CACHE = {}
+	PASSWORD_HASHING = {}
+	TOKENS = {}
+	BULK = {}
+	STATIC = {}
+	METRICS = {}
+	STARTUP = {}
+	CHANGES = {}
+	COMPRESSION = {}
+	RATE_LIMIT = {}
+
+# RECHARGEMENT
+_reload_callbacks = []
+
+def on_config_reload(callback):
+	"""Enregistre une fonction appelée après chaque rechargement de config.json"""
+	_reload_callbacks.append(callback)
+	return callback
+
+def reload_config():
+	"""
+	Relit config.json et notifie les abonnés (caches de pages...)
+	Seules les valeurs lues à chaque requête (utils.CONFIG['api']...) changent à chaud,
+	les autres sections (database, security...) sont prises en compte au redémarrage
+	"""
+	global CONFIG
+	if file.exist(path):
+		CONFIG = file.json_read(path)
+	for callback in _reload_callbacks:
+		callback()
+	return CONFIG
@@ -0,0 +1,5 @@
+"""
+Benchmarks de l'API
+
+Chaque module est exécutable séparément : python -m benchmarks.<module> --help
+"""
@@ -0,0 +1,127 @@
+"""
+Benchmark : sessions synchrones vs asynchrones appelées depuis des routes `async def`
+
+Simule N requêtes concurrentes exécutant chacune une recherche par nom d'utilisateur
+et une requête plus lourde (LIKE sur full_name). Mesure le débit et la latence maximale
+de la boucle d'événements : en mode synchrone chaque requête SQL bloque la boucle.
+
+--rtt-ms simule l'aller-retour réseau d'une base distante (PostgreSQL...) via une
+fonction SQL `rtt()` qui dort côté connexion ; avec --rtt-ms 0 on mesure SQLite local seul.
+
+Usage : python -m benchmarks.async_db --users 20000 --concurrency 50 --requests 500
+"""
+import argparse, asyncio, json, os, statistics, tempfile, time
+
+from sqlmodel import SQLModel, Session, create_engine, select, insert, func
+from sqlalchemy import event
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from api import models
+
+
+# -----------------------------------------------
+def seed(engine, users: int):
+    SQLModel.metadata.create_all(engine)
+    rows = [
+        {"username": f"user{i}", "full_name": f"User {i}", "email": f"user{i}@example.com",
+         "hashed_password": "x", "is_admin": i == 0, "is_disabled": False, "is_visible": True}
+        for i in range(users)
+    ]
+    with Session(engine) as db:
+        db.exec(insert(models.Users), params=rows)
+        db.commit()
+
+def _install_rtt(engine, rtt_ms: float):
+    """Ajoute la fonction SQL rtt() qui simule la latence réseau d'un serveur de base de données"""
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        dbapi_connection.create_function("rtt", 0, lambda: time.sleep(rtt_ms / 1000) or 1)
+
+def _statements(i: int, users: int):
+    by_username = select(models.Users).where(models.Users.username == f"user{i % users}").where(func.rtt() == 1)
+    heavy = select(models.Users.id).where(models.Users.full_name.like(f"%{i % 97}7%")).limit(5)
+    return by_username, heavy
+
+# -----------------------------------------------
+async def _probe_loop(stop: asyncio.Event, lags: list):
+    """Mesure le retard de la boucle d'événements (sommeil de 1 ms attendu)"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - start - 0.001)
+
+async def _run(handler, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await handler(i)
+            latencies.append(time.perf_counter() - start)
+
+    stop, lags = asyncio.Event(), []
+    probe = asyncio.create_task(_probe_loop(stop, lags))
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe
+    latencies.sort()
+    return {
+        "requests": requests,
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(requests / elapsed, 1),
+        "latency_p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "latency_p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3),
+        "loop_lag_max_ms": round(max(lags, default=0.0) * 1000, 3),
+    }
+
+# -----------------------------------------------
+async def main(args):
+    directory = tempfile.mkdtemp(prefix="bench_async_db_")
+    path = os.path.join(directory, "bench.db")
+    engine = create_engine(f"sqlite:///{path}", pool_size=args.pool_size)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", pool_size=args.pool_size)
+    _install_rtt(engine, args.rtt_ms)
+    _install_rtt(async_engine.sync_engine, args.rtt_ms)
+    seed(engine, args.users)
+
+    async def sync_handler(i):
+        # Comportement historique : Session synchrone dans une coroutine
+        by_username, heavy = _statements(i, args.users)
+        with Session(engine) as db:
+            db.exec(by_username).first()
+            db.exec(heavy).all()
+
+    async def async_handler(i):
+        by_username, heavy = _statements(i, args.users)
+        async with AsyncSession(async_engine) as db:
+            (await db.exec(by_username)).first()
+            (await db.exec(heavy)).all()
+
+    # Préchauffage des deux pools de connexions
+    await _run(sync_handler, args.pool_size, args.pool_size)
+    await _run(async_handler, args.pool_size, args.pool_size)
+
+    result = {
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "rtt_ms": args.rtt_ms,
+        "sync_session": await _run(sync_handler, args.requests, args.concurrency),
+        "async_session": await _run(async_handler, args.requests, args.concurrency),
+    }
+    result["speedup"] = round(result["async_session"]["throughput_rps"] / result["sync_session"]["throughput_rps"], 2)
+    await async_engine.dispose()
+    engine.dispose()
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--rtt-ms", type=float, default=2.0)
+    asyncio.run(main(parser.parse_args()))
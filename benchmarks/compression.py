@@ -0,0 +1,95 @@
+"""
+Benchmark : compression des réponses par api.compression.CompressionMiddleware
+
+Appelle directement (sans serveur ni client HTTP) une application ASGI qui renvoie une liste JSON
+de N utilisateurs, en un seul message ou en flux (NDJSON par paquets), pour chaque encodage disponible
+et chaque niveau demandé. Rapporte la taille compressée, le ratio et le temps CPU par réponse
+(celui relevé par le middleware pour /api/metrics).
+
+Usage : python -m benchmarks.compression --users 1000 --responses 200 --gzip-levels 1 6 9
+"""
+import argparse, asyncio, datetime as dt, json
+
+from api import compression, serialization
+
+
+def _payloads(users: int, chunk_size: int) -> tuple:
+    rows = [{
+        "id": index,
+        "username": f"user{index}",
+        "full_name": f"Utilisateur {index}",
+        "email": f"user{index}@example.com",
+        "image_url": None,
+        "arrival": None,
+        "is_disabled": False,
+        "is_admin": False,
+        "is_visible": True,
+        "created_at": dt.datetime(2024, 1, 1) + dt.timedelta(minutes=index),
+    } for index in range(users)]
+    lines = [serialization.dumps(row) + b"\n" for row in rows]
+    chunks = [b"".join(lines[start:start + chunk_size]) for start in range(0, users, chunk_size)]
+    return serialization.dumps(rows), chunks
+
+def _app(body: bytes, chunks: list):
+    async def app(scope, receive, send):
+        if chunks:
+            await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/x-ndjson")]})
+            for chunk in chunks:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        else:
+            await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+            await send({"type": "http.response.body", "body": body})
+    return app
+
+async def _receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+async def _send(message):
+    pass
+
+# -----------------------------------------------
+async def _measure(app, encoding: str, responses: int) -> dict:
+    scope = {"type": "http", "method": "GET", "headers": [(b"accept-encoding", encoding.encode())]}
+    stats = compression.CompressionStats()
+    token = compression.COMPRESSION_STATS.set(stats)
+    try:
+        for _ in range(responses):
+            await app(scope, _receive, _send)
+    finally:
+        compression.COMPRESSION_STATS.reset(token)
+    return {
+        "bytes_out": stats.bytes_out // responses,
+        "ratio": round(stats.bytes_in / stats.bytes_out, 2),
+        "cpu_us": round(stats.seconds / responses * 1e6, 1),
+    }
+
+def _settings(args) -> list:
+    settings = [("gzip", "GZIP_LEVEL", level) for level in args.gzip_levels]
+    if compression.brotli is not None:
+        settings += [("br", "BROTLI_QUALITY", level) for level in args.brotli_qualities]
+    if compression.zstandard is not None:
+        settings += [("zstd", "ZSTD_LEVEL", level) for level in args.zstd_levels]
+    return settings
+
+async def run(args) -> dict:
+    body, chunks = _payloads(args.users, args.chunk_size)
+    result = {"users": args.users, "bytes": len(body), "available": [name for name, available in compression.AVAILABLE.items() if available]}
+    for mode, app in (("single", _app(body, None)), ("stream", _app(body, chunks))):
+        middleware = compression.CompressionMiddleware(app)
+        for encoding, setting, level in _settings(args):
+            # Les encodeurs lisent le niveau à leur création
+            setattr(compression, setting, level)
+            compression.ENCODINGS = (encoding,)
+            result[f"{mode}_{encoding}_{level}"] = await _measure(middleware, encoding, args.responses)
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--responses", type=int, default=200)
+    parser.add_argument("--chunk-size", type=int, default=100, help="Lignes par morceau en mode flux")
+    parser.add_argument("--gzip-levels", type=int, nargs="+", default=[1, 6, 9])
+    parser.add_argument("--brotli-qualities", type=int, nargs="+", default=[1, 4, 6])
+    parser.add_argument("--zstd-levels", type=int, nargs="+", default=[1, 3, 9])
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
@@ -0,0 +1,216 @@
+"""
+Test de charge reproductible de l'API
+
+`run` : démarre l'application dans le processus (lifespan compris, client httpx sur le transport ASGI)
+avec une configuration et une base SQLite temporaires contenant N utilisateurs, puis appelle
+chaque route à la concurrence demandée. Résultat JSON : latences p50/p95/p99, débit, erreurs
+et pic de mémoire (RSS) du processus.
+
+`compare` : compare deux résultats et sort en erreur (code 1) si une route régresse au-delà du seuil
+(p95 plus lent ou débit plus faible de plus de --threshold %) ou renvoie des erreurs : une route qui
+échoue vite ne doit pas passer pour une accélération.
+
+Usage :
+    python -m benchmarks.load run --users 100000 --requests 2000 --concurrency 32 --output new.json
+    python -m benchmarks.load compare base.json new.json --threshold 10
+"""
+import argparse, asyncio, datetime as dt, json, os, sys, tempfile, time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROUTES = ("token", "me", "id", "name", "list", "create")
+PASSWORD = "benchmark-password"
+ADMIN_PASSWORD = "benchmark-admin-password"
+SEED_BATCH = 10000
+
+
+# -----------------------------------------------
+def _write_config(directory: str) -> str:
+    """Configuration temporaire dérivée du template : base SQLite dédiée, pas de build des assets"""
+    with open("config.json.template", encoding="utf-8") as handle:
+        config = json.load(handle)
+    config["database"]["url"] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    config["database"]["async_url"] = ""
+    config["database"]["debug"] = False
+    config["security"]["password"] = ADMIN_PASSWORD
+    config["tokens"]["secret"] = "benchmark-secret"
+    config.setdefault("static", {})["precompress"] = False
+    # Un seul client local : les seaux par IP de /token refuseraient l'essentiel des connexions mesurées
+    config.setdefault("rate_limit", {})["enabled"] = False
+    path = os.path.join(directory, "config.json")
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(config, handle, indent=1)
+    return path
+
+def seed(users: int):
+    """Insère N utilisateurs (user0 .. userN-1) partageant le même hash de mot de passe"""
+    from sqlmodel import Session, insert
+    from api import database, hashing, models
+
+    database.create_db_and_tables()
+    hashed_password = hashing.hash_password(PASSWORD)
+    now = dt.datetime.now()
+    with Session(database.engine) as db:
+        for start in range(0, users, SEED_BATCH):
+            db.exec(insert(models.Users), params=[
+                {"username": f"user{i}", "full_name": f"User {i}", "email": f"user{i}@example.com",
+                 "hashed_password": hashed_password, "is_admin": False, "is_disabled": False,
+                 "is_visible": True, "created_at": now}
+                for i in range(start, min(start + SEED_BATCH, users))
+            ])
+        db.commit()
+
+# -----------------------------------------------
+def _percentile(values: list, percent: float) -> float:
+    index = min(len(values) - 1, max(0, int(round(len(values) * percent / 100)) - 1))
+    return values[index]
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss : kilo-octets sous Linux, octets sous macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _request(client, route: str, i: int, users: int, headers: dict, run_id: str):
+    if route == "token":
+        # /token n'accepte que les administrateurs actifs : l'utilisateur de sécurité de la configuration
+        from api import utils
+        return client.post("/token", data={"username": utils.SECURITY["username"], "password": ADMIN_PASSWORD})
+    if route == "me":
+        return client.get("/security/me", headers=headers)
+    if route == "id":
+        return client.get(f"/api/users/id/{1 + i % users}/")
+    if route == "name":
+        return client.get(f"/api/users/name/user{i % users}/")
+    if route == "list":
+        return client.get("/api/users/list", params={"limit": 100}, headers=headers)
+    if route == "create":
+        username = f"bench_{run_id}_{i}"
+        return client.post("/api/users/create/", headers=headers,
+                           json={"username": username, "email": f"{username}@example.com", "password": PASSWORD})
+    raise ValueError(f"Route inconnue : {route}")
+
+async def _measure(client, route: str, requests: int, concurrency: int, users: int, headers: dict, run_id: str):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await _request(client, route, i, users, headers, run_id)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(requests / elapsed, 1),
+        "latency_p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "latency_p95_ms": round(_percentile(latencies, 95) * 1000, 3),
+        "latency_p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+async def run(args) -> dict:
+    directory = tempfile.mkdtemp(prefix="bench_load_")
+    # Avant tout import de api : utils lit la configuration à l'import
+    os.environ["API_CONFIG"] = _write_config(directory)
+
+    import httpx
+    from api import utils
+    from api.main import app
+
+    seed_start = time.perf_counter()
+    seed(args.users)
+    seed_seconds = time.perf_counter() - seed_start
+
+    routes = args.routes.split(",") if args.routes else list(ROUTES)
+    run_id = str(int(time.time()))
+    result = {
+        "users": args.users,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "seed_seconds": round(seed_seconds, 2),
+        "python": sys.version.split()[0],
+        "routes": {},
+    }
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            response = await client.post("/token", data={"username": utils.SECURITY["username"], "password": ADMIN_PASSWORD})
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            for route in routes:
+                # Préchauffage (caches, pools de connexions) puis mesure
+                await _measure(client, route, min(args.concurrency, args.requests), args.concurrency, args.users, headers, f"warmup{run_id}")
+                result["routes"][route] = await _measure(client, route, args.requests, args.concurrency, args.users, headers, run_id)
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+# -----------------------------------------------
+def compare(base: dict, new: dict, threshold: float) -> list:
+    """Liste des régressions (route, métrique, ancienne valeur, nouvelle valeur, écart en %)"""
+    regressions = []
+    for route, before in base["routes"].items():
+        after = new["routes"].get(route)
+        if after is None:
+            continue
+        if after["errors"] or after["errors"] > before["errors"]:
+            # Écart en % des requêtes de la route
+            regressions.append((route, "errors", before["errors"], after["errors"], round((after["errors"] - before["errors"]) / after["requests"] * 100, 1)))
+        slower = (after["latency_p95_ms"] - before["latency_p95_ms"]) / before["latency_p95_ms"] * 100 if before["latency_p95_ms"] else 0.0
+        if slower > threshold:
+            regressions.append((route, "latency_p95_ms", before["latency_p95_ms"], after["latency_p95_ms"], round(slower, 1)))
+        fewer = (before["throughput_rps"] - after["throughput_rps"]) / before["throughput_rps"] * 100 if before["throughput_rps"] else 0.0
+        if fewer > threshold:
+            regressions.append((route, "throughput_rps", before["throughput_rps"], after["throughput_rps"], round(-fewer, 1)))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Exécute le test de charge")
+    run_parser.add_argument("--users", type=int, default=1000, help="Utilisateurs en base (1000, 100000, 1000000...)")
+    run_parser.add_argument("--requests", type=int, default=1000, help="Requêtes par route")
+    run_parser.add_argument("--concurrency", type=int, default=32)
+    run_parser.add_argument("--routes", default="", help=f"Sous-ensemble de routes séparées par des virgules ({','.join(ROUTES)})")
+    run_parser.add_argument("--output", default="", help="Fichier JSON de résultat (sortie standard sinon)")
+
+    compare_parser = commands.add_parser("compare", help="Compare deux résultats")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="Régression tolérée en %%")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        result = json.dumps(asyncio.run(run(args)), indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as handle:
+                handle.write(result + "\n")
+        print(result)
+        return 0
+
+    with open(args.base, encoding="utf-8") as handle:
+        base = json.load(handle)
+    with open(args.new, encoding="utf-8") as handle:
+        new = json.load(handle)
+    regressions = compare(base, new, args.threshold)
+    for route, metric, before, after, change in regressions:
+        print(f"RÉGRESSION {route} {metric}: {before} -> {after} ({change:+}%)", file=sys.stderr)
+    print(json.dumps({"threshold": args.threshold, "regressions": len(regressions)}))
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+Benchmark : surcoût par requête de api.metrics.MetricsMiddleware
+
+Appelle directement (sans serveur ni client HTTP) une application ASGI minimale,
+avec et sans le middleware, et rapporte la différence en microsecondes par requête.
+
+Usage : python -m benchmarks.metrics --requests 200000
+"""
+import argparse, asyncio, json, time
+
+from api import metrics
+
+
+class _Route:
+    path = "/api/users/get/{user_id}"
+
+async def _app(scope, receive, send):
+    scope["route"] = _Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+async def _receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+async def _send(message):
+    pass
+
+# -----------------------------------------------
+async def _run(app, requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app({"type": "http", "method": "GET", "path": "/api/users/get/1", "root_path": ""}, _receive, _send)
+    return time.perf_counter() - start
+
+async def main(args):
+    instrumented = metrics.MetricsMiddleware(_app, registry=metrics.Registry())
+    # Préchauffage
+    await _run(_app, 1000)
+    await _run(instrumented, 1000)
+
+    bare = min([await _run(_app, args.requests) for _ in range(args.repeat)])
+    with_metrics = min([await _run(instrumented, args.requests) for _ in range(args.repeat)])
+    print(json.dumps({
+        "requests": args.requests,
+        "bare_us": round(bare / args.requests * 1e6, 3),
+        "instrumented_us": round(with_metrics / args.requests * 1e6, 3),
+        "overhead_us": round((with_metrics - bare) / args.requests * 1e6, 3),
+    }, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
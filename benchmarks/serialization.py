@@ -0,0 +1,67 @@
+"""
+Benchmark : sérialisation des utilisateurs (listes / export)
+
+Compare, sur N lignes models.Users en mémoire :
+  - l'ancien chemin : schemas.UserRead par ligne + jsonable_encoder + JSONResponse
+  - api.serialization : attrgetter précompilé + orjson (ou json si orjson n'est pas installé)
+Résultat en microsecondes par ligne (meilleur de --repeat passes).
+
+Usage : python -m benchmarks.serialization --rows 1000 --repeat 20
+"""
+import argparse, datetime as dt, json, time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from api import models, crud, serialization
+
+
+# -----------------------------------------------
+def make_users(rows: int):
+    now = dt.datetime.now()
+    return [
+        models.Users(
+            id=i, username=f"user{i}", full_name=f"User {i}", email=f"user{i}@example.com",
+            hashed_password="x", image_url=None, arrival=now, is_admin=False, is_disabled=False,
+            is_visible=True, created_at=now
+        )
+        for i in range(rows)
+    ]
+
+def _best(fn, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+# -----------------------------------------------
+def main(args):
+    users = make_users(args.rows)
+
+    def baseline():
+        return JSONResponse(content=jsonable_encoder([crud.build_user_read(user) for user in users])).body
+
+    def fast():
+        return serialization.RawJSONResponse(serialization.encode_users(users)).body
+
+    # Les deux chemins doivent produire le même document
+    assert json.loads(baseline()) == json.loads(fast())
+
+    result = {"rows": args.rows, "backend": serialization.BACKEND}
+    for name, fn in (("jsonable_encoder", baseline), ("serialization", fast)):
+        seconds = _best(fn, args.repeat)
+        result[name] = {
+            "seconds": round(seconds, 5),
+            "us_per_row": round(seconds / args.rows * 1e6, 3),
+        }
+    result["speedup"] = round(result["jsonable_encoder"]["seconds"] / result["serialization"]["seconds"], 2)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
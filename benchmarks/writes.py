@@ -0,0 +1,99 @@
+"""
+Benchmark : écritures en une requête (UPDATE / DELETE ... RETURNING) contre l'ancien chemin
+SELECT + modification en Python + UPDATE + COMMIT + refresh
+
+Base SQLite temporaire de N utilisateurs (configuration dérivée du template, comme benchmarks.load).
+Pour chaque chemin : requêtes SQL par opération (api.database.QueryStats) et latence moyenne.
+L'ancien chemin reproduit les lectures faites par la route PUT avant cette version
+(existence de l'utilisateur dans la route, puis lecture, écriture et relecture dans crud) ; il écrit aussi
+l'entrée du journal des modifications (api.changes), comme toute écriture actuelle.
+
+Usage : python -m benchmarks.writes --users 10000 --operations 2000
+"""
+import argparse, asyncio, json, os, tempfile, time
+
+from .load import _write_config, seed
+
+
+# -----------------------------------------------
+# Les modules api sont importés dans les fonctions : la configuration temporaire doit être en place avant
+
+async def _legacy_update(db, user_id: int, full_name: str):
+    from api import changes, crud, models
+    if await crud.async_get_user_by_id(db, user_id) is None:
+        return None
+    user = await crud.async_get_user_by_id(db, user_id)
+    user.full_name = full_name
+    user.revision = models.Users.revision + 1
+    db.add(user)
+    changes.record_change(db, "update", user)
+    await db.commit()
+    await db.refresh(user)
+    return crud.build_user_read(user)
+
+async def _legacy_delete(db, user_id: int):
+    from sqlmodel import select
+    from api import changes, crud, models
+    if await crud.async_get_user_by_id(db, user_id) is None:
+        return None
+    user = await crud.async_get_user_by_id(db, user_id)
+    username = user.username
+    changes.record_change(db, "delete", user)
+    await db.delete(user)
+    await db.commit()
+    # Ancienne révocation : lecture des sessions ouvertes (puis UPDATE s'il y en a)
+    await db.exec(select(models.ActiveSession.access_token).where(models.ActiveSession.username == username).where(models.ActiveSession.is_revoked == False))
+    return username
+
+async def _measure(operation, ids) -> dict:
+    from api.database import QUERY_STATS, QueryStats
+    stats = QueryStats()
+    token = QUERY_STATS.set(stats)
+    start = time.perf_counter()
+    try:
+        for user_id in ids:
+            await operation(user_id)
+    finally:
+        elapsed = time.perf_counter() - start
+        QUERY_STATS.reset(token)
+    return {
+        "operations": len(ids),
+        "queries_per_operation": round(stats.count / len(ids), 2),
+        "mean_us": round(elapsed / len(ids) * 1e6, 1),
+    }
+
+async def run(args) -> dict:
+    directory = tempfile.mkdtemp(prefix="bench_writes_")
+    # Avant tout import de api : utils lit la configuration à l'import
+    os.environ["API_CONFIG"] = _write_config(directory)
+
+    from sqlmodel.ext.asyncio.session import AsyncSession
+    from api import crud, database, schemas
+
+    seed(args.users)
+    user_update = schemas.UserUpdate(full_name="Benchmark")
+    operations = args.operations
+    update_ids = list(range(1, operations + 1))
+    # Suppressions : deux plages distinctes en fin de table
+    legacy_ids = list(range(args.users - 2 * operations + 1, args.users - operations + 1))
+    returning_ids = list(range(args.users - operations + 1, args.users + 1))
+    result = {"users": args.users, "operations": operations}
+
+    async with AsyncSession(database.async_engine) as db:
+        # Préchauffage (pool de connexions, compilation des requêtes)
+        await crud.async_update_user(db, 1, user_update)
+        await _legacy_update(db, 1, user_update.full_name)
+
+        result["update_legacy"] = await _measure(lambda user_id: _legacy_update(db, user_id, user_update.full_name), update_ids)
+        result["update_returning"] = await _measure(lambda user_id: crud.async_update_user(db, user_id, user_update), update_ids)
+        result["delete_legacy"] = await _measure(lambda user_id: _legacy_delete(db, user_id), legacy_ids)
+        result["delete_returning"] = await _measure(lambda user_id: crud.async_delete_user(db, user_id), returning_ids)
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--operations", type=int, default=2000, help="Opérations par chemin (au plus users / 2)")
+    args = parser.parse_args()
+    args.operations = min(args.operations, args.users // 2)
+    print(json.dumps(asyncio.run(run(args)), indent=2))